@@ -2,10 +2,7 @@ __version__ = '0.2.2'
 __author__ = 'Parth Sarin'
 __license__ = 'MIT'
 
-import py_compile
-import pycodestyle
-import contextlib
-import io
+import sys
 
 from .printing import StatusMessage, HeaderMessage, SuperHeaderMessage
 
@@ -19,7 +16,10 @@ class Autograder:
                  module_overrides={},
                  has_compile_check=True,
                  has_custom_tests=False,
-                 has_style_tests=True):
+                 has_style_tests=True,
+                 import_timeout=10,
+                 import_memory_limit=None,
+                 probe_import=False):
         """
         Initializes the autograder.
 
@@ -32,6 +32,13 @@ class Autograder:
             run_custom_tests function.
         has_style_tests (bool) -- Whether to run PEP8 style checking on the
             module.
+        import_timeout (float or None) -- The number of seconds importing the
+            module may take.
+        import_memory_limit (int or None) -- The number of bytes of memory
+            importing the module may allocate.
+        probe_import (bool) -- Whether to first import the module in a child
+            process which is killed when it runs out of time (even in a
+            C-level loop). The module's top-level code then runs twice.
         """
         self.module_name = module_name
         if module_name.endswith('.py'):
@@ -42,6 +49,11 @@ class Autograder:
         self.has_custom_tests = has_custom_tests
         self.has_style_tests = has_style_tests
 
+        self.import_timeout = import_timeout
+        self.import_memory_limit = import_memory_limit
+        self.probe_import = probe_import
+        self.import_result = None
+
 
     def run(self):
         """
@@ -52,7 +64,9 @@ class Autograder:
             "info"
         ))
 
-        self._load_module()
+        if self._load_module() is None:
+            # The module couldn't be imported, so there's nothing to test
+            return
 
         # Overwrites on the module
         self.module.__dict__.update(self.module_overrides)
@@ -66,6 +80,11 @@ class Autograder:
         if self.has_style_tests:
             self.run_style_tests()
 
+        # Watch mode: keep rerunning the affected tests on every save
+        if self.has_custom_tests and ('-w' in sys.argv
+                                      or '--watch' in sys.argv):
+            self.watch()
+
 
     def _load_module(self):
         """
@@ -75,7 +94,43 @@ class Autograder:
         if self.has_compile_check:
             self.run_compile_check() # will import the module
         else:
-            self.module = __import__(self.module_name)
+            self._import_module()
+
+        return self.module
+
+
+    def _import_module(self):
+        """
+        Imports the module with its printing captured, no input and the time
+        and memory budgets given in __init__. Sets self.module to None and
+        prints the problem if the import fails.
+        """
+        from .loading import IMPORT_OK, guarded_import
+        from .metrics import active, timed
+
+        with timed('import'):
+            self.import_result = guarded_import(
+                self.module_name, self.import_timeout,
+                self.import_memory_limit, self.probe_import
+            )
+        self.module = self.import_result.module
+
+        registry = active()
+        if registry is not None:
+            registry.imports.inc(status=self.import_result.status)
+
+        # Show anything the module printed at the top level
+        stdout = self.import_result.stdout
+        if stdout:
+            print(stdout, end='' if stdout.endswith('\n') else '\n')
+
+        if self.import_result.status != IMPORT_OK:
+            print(StatusMessage(
+                f"Couldn't import {self.module_name} "
+                f"({self.import_result.status}).",
+                'fail'
+            ))
+            print(self.import_result.error)
 
         return self.module
 
@@ -88,16 +143,27 @@ class Autograder:
             "Checking {} for syntax errors...".format(self.module_name)
         ))
 
+        import py_compile
+
         # Check for syntax errors
         py_compile.compile(self.module_name + '.py')
         print(StatusMessage("No syntax errors found.", "success"))
 
         # Import module
-        self.module = __import__(self.module_name)
+        self._import_module()
 
         print()
 
-        return True
+        return self.module is not None
+
+
+    def watch(self, interval=0.1):
+        """
+        Watches the student module and, whenever it is saved, reloads it and
+        reruns the custom tests that touch the functions that changed.
+        """
+        from .watch import Watcher
+        Watcher(self, interval).run()
 
 
     def run_custom_tests(self):
@@ -111,10 +177,15 @@ class Autograder:
             "Checking {} for PEP8 compliance...".format(self.module_name)
         ))
 
+        import contextlib
+        import io
+        import pycodestyle
+        from .metrics import timed
+
         # Get the PEP8 results quietly
         style = pycodestyle.StyleGuide()
 
-        with contextlib.redirect_stdout(io.StringIO()):
+        with contextlib.redirect_stdout(io.StringIO()), timed('style'):
             result = style.check_files([self.module_name + '.py'])
 
         # Pretty print results
@@ -0,0 +1,442 @@
+"""
+File: autograder/batch.py
+-------------------------
+
+Grades the submissions of a whole cohort. Before grading, each submission is
+fingerprinted so that identical submissions are only graded once and
+near-duplicates can be reported. Runs can be checkpointed in a journal so
+that an interrupted run resumes where it stopped.
+"""
+
+import ast
+import collections
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import time
+
+from .fixtures import close_batch_fixtures
+from .printing import StatusMessage, HeaderMessage
+from .testsuite import compact_responses, journal_tests
+
+Fingerprint = collections.namedtuple(
+    'Fingerprint', ('raw', 'normalized', 'structure')
+)
+
+BatchResult = collections.namedtuple(
+    'BatchResult', ('student', 'report', 'fingerprint', 'graded_with',
+                    'elapsed', 'import_status')
+)
+
+DEDUPE_LEVELS = ('raw', 'normalized', None)
+
+
+class _Normalizer(ast.NodeTransformer):
+    """
+    Strips docstrings from a syntax tree and, optionally, renames every
+    identifier to a placeholder in order of first appearance.
+    """
+
+    def __init__(self, rename):
+        self.rename = rename
+        self.names = {}
+
+
+    def _placeholder(self, name):
+        if not self.rename:
+            return name
+        return self.names.setdefault(name, f'_{len(self.names)}')
+
+
+    def _strip_docstring(self, node):
+        body = getattr(node, 'body', None)
+        if (isinstance(body, list) and body
+                and isinstance(body[0], ast.Expr)
+                and isinstance(body[0].value, ast.Constant)
+                and isinstance(body[0].value.value, str)):
+            node.body = body[1:] or [ast.Pass()]
+
+
+    def generic_visit(self, node):
+        self._strip_docstring(node)
+        return super().generic_visit(node)
+
+
+    def visit_Name(self, node):
+        node.id = self._placeholder(node.id)
+        return node
+
+
+    def visit_arg(self, node):
+        node.arg = self._placeholder(node.arg)
+        node.annotation = None
+        return node
+
+
+    def visit_FunctionDef(self, node):
+        node.name = self._placeholder(node.name)
+        return self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+
+    def visit_ClassDef(self, node):
+        node.name = self._placeholder(node.name)
+        return self.generic_visit(node)
+
+
+def _normalized_hash(source, rename):
+    """
+    Hashes the syntax tree of source without docstrings, comments, formatting
+    and (if rename is set) identifier names. Returns None if source doesn't
+    parse.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+
+    tree = _Normalizer(rename).visit(tree)
+    return hashlib.sha256(ast.dump(tree).encode()).hexdigest()
+
+
+def fingerprint(path):
+    """
+    Fingerprints the submission at path.
+
+    Returns
+    -------
+    Fingerprint -- The hash of the raw bytes, the hash of the normalized
+        syntax tree (ignoring comments, formatting and docstrings) and the
+        hash of the syntax tree with identifiers renamed. The last two are None
+        if the file doesn't parse.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+
+    try:
+        source = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        source = None
+
+    return Fingerprint(
+        hashlib.sha256(raw).hexdigest(),
+        source and _normalized_hash(source, rename=False),
+        source and _normalized_hash(source, rename=True),
+    )
+
+
+def _forget_modules(directory, keep=()):
+    """
+    Removes the modules imported from files under directory from
+    sys.modules (except the names in keep), so that the next submission
+    imports its own helper modules instead of reusing these.
+    """
+    prefix = os.path.join(os.path.abspath(directory), '')
+    for name, module in list(sys.modules.items()):
+        filename = getattr(module, '__file__', None)
+        if name in keep or not filename:
+            continue
+        if os.path.abspath(filename).startswith(prefix):
+            del sys.modules[name]
+
+
+class BatchGrader:
+    """
+    Runs an autograder over the submissions of many students.
+    """
+
+    def __init__(self, autograder_factory, submissions, dedupe='raw',
+                 journal=None, compact=False, metrics=None,
+                 journal_sync=None):
+        """
+        Initializes the batch grader.
+
+        Arguments
+        ---------
+        autograder_factory (function () -> Autograder) -- Builds the
+            autograder to run on each submission, like an Autograder subclass.
+        submissions (dict) -- Maps each student to the path of their module.
+            The file name should be the module name the autograder expects.
+        dedupe (str or None) -- Which submissions are graded once and share
+            their results: 'raw' for byte-identical files, 'normalized' for
+            files that only differ in comments, formatting and docstrings, or
+            None to grade every submission. Note that with 'normalized', the
+            style check and line numbers in tracebacks are shared as well.
+        journal (str or None) -- The path of a journal to checkpoint the run
+            in. Every test result and graded submission is appended to it, and
+            a rerun with the same journal replays them instead of grading
+            them again, so the reports match those of an uninterrupted run.
+        journal_sync (bool or None) -- Whether to fsync the journal after
+            every submission, so that it survives the machine going down (not
+            just the process). If None, it's synced when the grader is called
+            with a --sync-journal flag.
+        compact (bool) -- Whether the suites keep compact responses (see
+            autograder.compact), so that the responses kept by the tests of a
+            submission stay small while it's graded. The tests are dropped
+            after each submission, so the store is cleared then as well.
+        metrics (MetricsRegistry, str or None) -- The registry (or the path
+            of a file to write one to) that the tests, phases and submissions
+            of the run are recorded in (see autograder.metrics). It's written
+            to its file after every submission, and can also be served over
+            HTTP with its serve method while the run goes on.
+        """
+        if dedupe not in DEDUPE_LEVELS:
+            raise ValueError(
+                f"'{dedupe}' is not a valid dedupe level (expected one of "
+                f"{DEDUPE_LEVELS})."
+            )
+
+        self.autograder_factory = autograder_factory
+        self.submissions = dict(submissions)
+        self.dedupe = dedupe
+        self.journal = journal
+
+        if journal_sync is None:
+            journal_sync = '--sync-journal' in sys.argv
+        self.journal_sync = journal_sync
+
+        self.response_store = None
+        if compact:
+            from .compact import ResponseStore
+            self.response_store = ResponseStore()
+
+        if isinstance(metrics, str):
+            from .metrics import MetricsRegistry
+            metrics = MetricsRegistry(metrics)
+
+        self.metrics = metrics
+
+        self.fingerprints = {}
+        self.results = {}
+
+
+    def _group_key(self, student):
+        """
+        Returns the key that groups student with the submissions that share
+        its grading.
+        """
+        fp = self.fingerprints[student]
+        if self.dedupe == 'normalized' and fp.normalized:
+            return fp.normalized
+        if self.dedupe:
+            return fp.raw
+        return student
+
+
+    def groups(self):
+        """
+        Returns a list of groups of students (in submission order) whose
+        submissions are graded once.
+        """
+        groups = collections.OrderedDict()
+        for student in self.submissions:
+            groups.setdefault(self._group_key(student), []).append(student)
+
+        return list(groups.values())
+
+
+    def near_duplicates(self):
+        """
+        Returns clusters of students whose submissions aren't byte-identical
+        but have the same normalized syntax tree or the same structure once
+        identifiers are renamed.
+
+        Returns
+        -------
+        list of (str, list) -- The kind of match ('normalized' or 'structure')
+            and the students in the cluster.
+        """
+        clusters = []
+        seen = set()
+
+        for level in ('normalized', 'structure'):
+            by_hash = collections.defaultdict(list)
+            for student, fp in self.fingerprints.items():
+                key = getattr(fp, level)
+                if key:
+                    by_hash[key].append(student)
+
+            for students in by_hash.values():
+                raws = {self.fingerprints[s].raw for s in students}
+                members = frozenset(students)
+                if len(raws) > 1 and members not in seen:
+                    seen.add(members)
+                    clusters.append((level, students))
+
+        return clusters
+
+
+    def _grade(self, path, journal=None):
+        """
+        Runs the autograder on the module at path and returns its report and
+        the status of the import of the module (or None if it wasn't
+        imported). If journal (a SubmissionJournal) is given, the tests it
+        has results for are replayed and the others are recorded in it.
+        """
+        directory, filename = os.path.split(os.path.abspath(path))
+        module_name = filename[:-3] if filename.endswith('.py') else filename
+
+        old_cwd = os.getcwd()
+        old_path = list(sys.path)
+        old_modules = set(sys.modules)
+
+        # Make sure the module is imported from this submission
+        sys.modules.pop(module_name, None)
+        os.chdir(directory)
+        sys.path.insert(0, directory)
+
+        f = io.StringIO()
+        autograder, import_status = None, None
+        try:
+            autograder = self.autograder_factory()
+            with contextlib.redirect_stdout(f), journal_tests(journal), \
+                    compact_responses(self.response_store):
+                autograder.run()
+
+        except Exception as e:
+            print(StatusMessage(f"The autograder crashed: {e!r}", 'fail'),
+                  file=f)
+
+        finally:
+            os.chdir(old_cwd)
+            sys.path[:] = old_path
+            sys.modules.pop(module_name, None)
+
+            # Helper modules the submission imported from its directory (but
+            # not modules like the solution that were loaded before)
+            _forget_modules(directory, keep=old_modules)
+
+            # The autograder (and the responses its tests kept) is dropped
+            if self.response_store is not None:
+                self.response_store.clear()
+
+            import_result = getattr(autograder, 'import_result', None)
+            if import_result:
+                import_status = import_result.status
+
+        return f.getvalue(), import_status
+
+
+    def run(self):
+        """
+        Fingerprints and grades every submission.
+
+        Returns
+        -------
+        dict -- Maps each student to their BatchResult.
+        """
+        print(HeaderMessage(
+            f"Grading {len(self.submissions)} submissions..."
+        ))
+
+        for student, path in self.submissions.items():
+            self.fingerprints[student] = fingerprint(path)
+
+        journal = None
+        if self.journal:
+            from .journal import Journal
+            journal = Journal(self.journal, sync=self.journal_sync)
+
+        from .metrics import active, recording
+
+        registry = self.metrics or active()
+        try:
+            groups = self.groups()
+            num_resumed = 0
+            with recording(registry):
+                for group in groups:
+                    num_resumed += self._grade_group(group, journal,
+                                                     registry)
+        finally:
+            if journal:
+                journal.close()
+            close_batch_fixtures()
+
+        self._print_summary(len(groups), num_resumed)
+        return self.results
+
+
+    def _grade_group(self, group, journal, registry=None):
+        """
+        Grades the first submission of group (or takes its results from the
+        journal) and shares the results with the rest of the group, recording
+        the submission in registry (a MetricsRegistry) if it's given. Returns
+        whether the results came from the journal.
+        """
+        representative = group[0]
+        sha = self.fingerprints[representative].raw
+
+        graded = journal and journal.submission(representative, sha)
+        if graded:
+            report, import_status, elapsed = graded
+        else:
+            start = time.perf_counter()
+            report, import_status = self._grade(
+                self.submissions[representative],
+                journal and journal.for_submission(representative, sha)
+            )
+            elapsed = time.perf_counter() - start
+
+            if journal:
+                journal.record_submission(representative, sha, report,
+                                          import_status, elapsed)
+
+        if registry:
+            registry.submissions.inc(source='journal' if graded else 'graded')
+            if not graded:
+                registry.submission_seconds.observe(elapsed)
+            registry.flush()
+
+        for student in group:
+            self.results[student] = BatchResult(
+                student, report, self.fingerprints[student],
+                None if student == representative else representative,
+                elapsed, import_status
+            )
+
+        shared = (f" (shared with {len(group) - 1} identical)"
+                  if len(group) > 1 else '')
+        if import_status not in (None, 'ok'):
+            shared += f" {StatusMessage(f'import {import_status}', 'fail')}"
+        if graded:
+            shared += f" {StatusMessage('from journal', 'info')}"
+
+        print(f"{representative:68}"
+              f"{StatusMessage(f'{elapsed:.2f}s', 'info')}{shared}")
+
+        return bool(graded)
+
+
+    def _print_summary(self, num_graded, num_resumed=0):
+        print()
+        print(StatusMessage(
+            f"Graded {num_graded} unique submissions for "
+            f"{len(self.submissions)} students.",
+            'success'
+        ))
+        if num_resumed:
+            print(StatusMessage(
+                f"{num_resumed} of them were taken from the journal.", 'info'
+            ))
+
+        clusters = self.near_duplicates()
+        if clusters:
+            print(StatusMessage(
+                f"{len(clusters)} cluster(s) of near-duplicate submissions:",
+                'warning'
+            ))
+            for level, students in clusters:
+                print(f"  [{level}] {', '.join(students)}")
+
+
+    def write_reports(self, directory):
+        """
+        Writes each student's report to directory/<student>.txt.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for student, result in self.results.items():
+            with open(os.path.join(directory, f'{student}.txt'), 'w') as f:
+                f.write(result.report)
@@ -0,0 +1,260 @@
+"""
+File: autograder/compact.py
+---------------------------
+
+A compact form of test responses for runs that keep the results of many
+tests (and students) alive. Passing responses only keep digests of their
+fields, identical responses (like the solution's output for every student)
+are shared, and large fields of failing responses are spilled to compressed
+files that are loaded when they're read.
+"""
+
+import hashlib
+import itertools
+import os
+import pickle
+
+# The fields of a TestResponse that are compacted
+FIELDS = ('output', 'stdout', 'stderr', 'error', 'warning')
+
+
+class Digest(bytes):
+    """
+    The digest of a field that wasn't kept.
+    """
+    __slots__ = ()
+
+
+# The number of characters of a string hashed at a time
+_CHUNK_SIZE = 1 << 16
+
+# Numbers the values that can't be digested (see digest)
+_unique_ids = itertools.count()
+
+
+class _HashWriter:
+    """
+    A file-like object that feeds what's written to it to a hash, so that
+    values are pickled into the hash in chunks.
+    """
+
+    def __init__(self, hash):
+        self.hash = hash
+
+
+    def write(self, data):
+        self.hash.update(data)
+        return len(data)
+
+
+def digest(value):
+    """
+    Returns a Digest of value: of its text for strings, and of its type and
+    pickle otherwise. Both are hashed in bounded chunks, and the kind of value
+    is hashed as well, so a string never has the digest of another value.
+    Values that can't be pickled get a digest of their own, so they're never
+    shared.
+    """
+    hash = hashlib.blake2b(digest_size=16)
+    if isinstance(value, str):
+        hash.update(b's')
+        for start in range(0, len(value), _CHUNK_SIZE):
+            chunk = value[start:start + _CHUNK_SIZE]
+            hash.update(chunk.encode('utf-8', 'replace'))
+        return Digest(hash.digest())
+
+    cls = type(value)
+    name = f'{cls.__module__}.{cls.__qualname__}'
+    hash.update(b'p' + name.encode('utf-8', 'replace') + b'\0')
+    try:
+        pickled = hash.copy()
+        pickle.Pickler(_HashWriter(pickled),
+                       pickle.HIGHEST_PROTOCOL).dump(value)
+        return Digest(pickled.digest())
+    except Exception:
+        # Like a student object whose __reduce__ raises
+        hash.update(f'u{id(value)}\0{os.getpid()}\0'
+                    f'{next(_unique_ids)}'.encode())
+        return Digest(hash.digest())
+
+
+class Blob:
+    """
+    A field that was spilled to a compressed file.
+    """
+    __slots__ = ('path', 'size')
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+
+
+    def load(self):
+        import zlib
+
+        with open(self.path, 'rb') as f:
+            return pickle.loads(zlib.decompress(f.read()))
+
+
+def _field_property(field):
+    return property(
+        lambda self: self._field(field),
+        doc=f"The {field} of the response (None if only its digest was kept)."
+    )
+
+
+class CompactResponse:
+    """
+    A compact, read-only TestResponse. Each field is either kept, spilled to a
+    Blob (and loaded when it's read) or only kept as a Digest, in which case
+    reading it returns None.
+    """
+    __slots__ = (('name', 'passed', 'digests')
+                 + tuple(f'_{field}' for field in FIELDS))
+
+    def __init__(self, name, passed, digests, fields):
+        self.name = name
+        self.passed = passed
+        self.digests = digests
+        for field, value in zip(FIELDS, fields):
+            setattr(self, f'_{field}', value)
+
+
+    def _field(self, field):
+        value = getattr(self, f'_{field}')
+        if isinstance(value, Blob):
+            return value.load()
+        if isinstance(value, Digest):
+            return None
+        return value
+
+    output = _field_property('output')
+    stdout = _field_property('stdout')
+    stderr = _field_property('stderr')
+    error = _field_property('error')
+    warning = _field_property('warning')
+
+
+    def __repr__(self):
+        state = 'passed' if self.passed else 'failed'
+        return f"<CompactResponse {self.name} ({state})>"
+
+
+class ResponseStore:
+    """
+    Turns TestResponses into CompactResponses, sharing identical ones and
+    spilling the large fields of failing ones to a directory of compressed
+    blobs. The blobs are deleted when the store is garbage collected.
+    """
+
+    def __init__(self, directory=None, spill_size=1024):
+        """
+        Arguments
+        ---------
+        directory (str or None) -- Where to write the blobs (a new temporary
+            directory by default).
+        spill_size (int) -- The size (in characters for strings and pickled
+            bytes otherwise) above which the fields of failing responses are
+            spilled.
+        """
+        self.directory = directory
+        self.spill_size = spill_size
+
+        # (name, passed, digests) -> CompactResponse
+        self._interned = {}
+        self._finalizer = None
+
+
+    def _blob_directory(self):
+        if self.directory is None:
+            import shutil
+            import tempfile
+            import weakref
+
+            self.directory = tempfile.mkdtemp(prefix='autograder-responses-')
+            self._finalizer = weakref.finalize(
+                self, shutil.rmtree, self.directory, ignore_errors=True
+            )
+
+        return self.directory
+
+
+    def _spill(self, value, value_digest):
+        """
+        Returns a Blob of value if it's large enough to spill, or value.
+        """
+        if value is None:
+            return None
+        if isinstance(value, str) and len(value) <= self.spill_size:
+            return value
+
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return value
+        if len(data) <= self.spill_size:
+            return value
+
+        import zlib
+
+        # Blobs are named by their digest, so repeated outputs share a file
+        path = os.path.join(self._blob_directory(), value_digest.hex())
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(zlib.compress(data))
+
+        return Blob(path, len(data))
+
+
+    def clear(self):
+        """
+        Forgets the responses compacted so far and deletes their blobs. Used
+        between batch graded submissions, once the tests that kept the
+        responses are gone.
+        """
+        self._interned = {}
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+            self.directory = None
+
+
+    def compact(self, response, passed):
+        """
+        Returns the CompactResponse of response, a TestResponse from a test
+        that passed (only the digests are kept) or failed (the fields are
+        kept, with large ones spilled).
+        """
+        if isinstance(response, CompactResponse):
+            return response
+
+        values = [getattr(response, field) for field in FIELDS]
+        digests = tuple(value if value is None else digest(value)
+                        for value in values)
+
+        key = (response.name, bool(passed), digests)
+        interned = self._interned.get(key)
+        if interned is not None:
+            return interned
+
+        if passed:
+            fields = digests
+        else:
+            fields = [self._spill(value, value_digest) for value, value_digest
+                      in zip(values, digests)]
+
+        compacted = CompactResponse(response.name, bool(passed), digests,
+                                    fields)
+        self._interned[key] = compacted
+        return compacted
+
+
+    def compact_test(self, test, passed):
+        """
+        Replaces the responses stored on test (after it ran) with their
+        compact forms.
+        """
+        for attr in ('solution_response', 'student_response'):
+            response = getattr(test, attr, None)
+            if response is not None:
+                setattr(test, attr, self.compact(response, passed))
@@ -0,0 +1,111 @@
+"""
+File: autograder/descriptors.py
+-------------------------------
+
+Lightweight, picklable descriptions of tests. A descriptor refers to
+functions by their module and qualified name instead of holding them, so it
+can be sent to a worker process under any multiprocessing start method and
+turned back into a test there.
+"""
+
+import collections
+import importlib
+
+
+class DescriptorError(ValueError):
+    """
+    Error that is raised when a test refers to an object that can't be
+    imported by name (like a lambda or a nested function).
+    """
+    pass
+
+
+# Objects that have already been resolved in this process
+_resolved = {}
+
+
+class ObjectRef(collections.namedtuple('ObjectRef', ('module', 'qualname'))):
+    """
+    A reference to a module-level object by its module and qualified name.
+    """
+
+    @classmethod
+    def of(cls, obj):
+        """
+        Builds a reference to obj, checking that it resolves back to obj.
+        """
+        module = getattr(obj, '__module__', None)
+        qualname = getattr(obj, '__qualname__', None)
+
+        if module is None or qualname is None or '<' in qualname:
+            raise DescriptorError(
+                f"Can't refer to {obj!r} by name (is it a lambda or a nested "
+                f"function?)."
+            )
+
+        ref = cls(module, qualname)
+        try:
+            resolved = ref.resolve()
+        except (ImportError, AttributeError):
+            resolved = None
+
+        if resolved is not obj:
+            raise DescriptorError(
+                f"{module}.{qualname} doesn't refer to {obj!r}."
+            )
+
+        return ref
+
+
+    def resolve(self):
+        """
+        Imports the module (once per process) and looks up the object.
+        """
+        try:
+            return _resolved[self]
+        except KeyError:
+            pass
+
+        obj = importlib.import_module(self.module)
+        for attr in self.qualname.split('.'):
+            obj = getattr(obj, attr)
+
+        _resolved[self] = obj
+        return obj
+
+
+TestDescriptorBase = collections.namedtuple(
+    'TestDescriptor', ('test_cls', 'fields')
+)
+
+
+class TestDescriptor(TestDescriptorBase):
+    """
+    A picklable description of a test: a reference to the test class and the
+    arguments to construct it with. Callable arguments are stored as
+    ObjectRefs.
+    """
+
+    @classmethod
+    def of(cls, test):
+        """
+        Describes test, raising a DescriptorError if it can't be described.
+        """
+        fields = {}
+        for name, value in test._describe().items():
+            if callable(value):
+                value = ObjectRef.of(value)
+            fields[name] = value
+
+        return cls(ObjectRef.of(type(test)), fields)
+
+
+    def resolve(self):
+        """
+        Rebuilds the test in the current process.
+        """
+        fields = {
+            name: value.resolve() if isinstance(value, ObjectRef) else value
+            for name, value in self.fields.items()
+        }
+        return self.test_cls.resolve()(**fields)
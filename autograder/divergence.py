@@ -0,0 +1,151 @@
+"""
+File: autograder/divergence.py
+------------------------------
+
+Finds the first line where two printed outputs diverge without diffing the
+whole outputs, and builds bounded context windows around it for the
+progressive diff.
+"""
+
+PROGRESSIVE_CHOICES = ('PRIOR', 'SUBSEQ', 'BOTH')
+
+
+def first_difference(a, b, block_size=4096):
+    """
+    Returns the index of the first character where a and b differ, or None if
+    they are equal. Blocks of the strings are compared at a time, so equal
+    prefixes are skipped at memory comparison speed.
+    """
+    if a == b:
+        return None
+
+    length = min(len(a), len(b))
+    start = 0
+    while start < length:
+        end = min(start + block_size, length)
+        if a[start:end] != b[start:end]:
+            # Binary search for the first differing character in the block
+            lo, hi = start, end
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if a[lo:mid] == b[lo:mid]:
+                    lo = mid
+                else:
+                    hi = mid
+            return lo
+        start = end
+
+    # One output is a prefix of the other
+    return length
+
+
+def _lines_before(text, pos, count):
+    """
+    Returns up to count complete lines that end before pos.
+    """
+    lines = []
+    end = pos
+    while end > 0 and len(lines) < count:
+        start = text.rfind('\n', 0, end - 1) + 1
+        lines.append(text[start:end - 1])
+        end = start
+
+    return lines[::-1]
+
+
+def _lines_from(text, pos, count):
+    """
+    Returns up to count lines starting at pos.
+    """
+    lines = []
+    start = pos
+    while start < len(text) and len(lines) < count:
+        end = text.find('\n', start)
+        if end == -1:
+            end = len(text)
+        lines.append(text[start:end])
+        start = end + 1
+
+    return lines
+
+
+def _diff_lines(expected, actual):
+    """
+    Returns the lines of a diff of two lists of lines, where the lines they
+    share are kept as context.
+    """
+    from difflib import SequenceMatcher
+
+    lines = []
+    matcher = SequenceMatcher(None, expected, actual, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            lines += [' ' + line for line in expected[i1:i2]]
+        else:
+            lines += ['-' + line for line in expected[i1:i2]]
+            lines += ['+' + line for line in actual[j1:j2]]
+
+    return lines
+
+
+class Divergence:
+    """
+    The first line where two outputs differ, along with the context windows
+    which are shown by the progressive diff. Only the windows are kept, so the
+    object is small and cheap to send between processes.
+    """
+
+    def __init__(self, expected, actual, from_name, to_name, context=50):
+        """
+        Arguments
+        ---------
+        expected, actual (str) -- The two outputs, which must differ.
+        from_name, to_name (str) -- The names of the two outputs.
+        context (int) -- The maximum number of lines in each window.
+        """
+        pos = first_difference(expected, actual)
+        line_start = expected.rfind('\n', 0, pos) + 1
+
+        self.line = expected.count('\n', 0, line_start) + 1
+        self.header = f"--- {from_name}\n+++ {to_name}"
+
+        expected_after = _lines_from(expected, line_start, context)
+        actual_after = _lines_from(actual, line_start, context)
+        before = [' ' + line
+                  for line in _lines_before(expected, line_start, context)]
+
+        first = []
+        if expected_after:
+            first.append('-' + expected_after[0])
+        if actual_after:
+            first.append('+' + actual_after[0])
+        self.first_error = '\n'.join(first)
+
+        marker = f"@@ line {self.line} @@"
+        after = _diff_lines(expected_after, actual_after)
+
+        self.prior = '\n'.join([self.header, marker] + before + first)
+        self.subsequent = '\n'.join([self.header, marker] + after)
+        self.both = '\n'.join([self.header, marker] + before + after)
+
+    def render(self, choice):
+        """
+        Returns the window for a progressive diff choice (PRIOR, SUBSEQ or
+        BOTH).
+        """
+        choice = choice.upper()
+        if choice == 'PRIOR':
+            return self.prior
+        elif choice == 'SUBSEQ':
+            return self.subsequent
+        else:
+            return self.both
+
+
+def ask_progressive_choice():
+    """
+    Asks the grader which part of a progressive diff to show.
+    """
+    msg = ("Type PRIOR to show the prior output, SUBSEQ for subsequent"
+           " output, or BOTH for\nboth: ")
+    return input(msg).upper()
@@ -0,0 +1,322 @@
+"""
+File: autograder/fixtures.py
+----------------------------
+
+Fixtures build the expensive inputs of tests (like a large data structure or
+a generated data file) once per scope instead of once per test:
+
+    'test'  -- built for each test that uses it (like setup_fn).
+    'suite' -- built once per TestSuite run (once per worker process in
+               multiprocessing mode, unless the fixture is shared).
+    'batch' -- built once per process and reused across suites and batch
+               graded submissions.
+
+Fixtures can depend on other fixtures of the same or a wider scope. Shared
+fixtures are built once in the parent process in multiprocessing mode and
+handed to the workers through a memory-mapped file.
+"""
+
+import itertools
+import os
+
+from .scratch import memory_directory
+
+FIXTURE_SCOPES = ('test', 'suite', 'batch')
+
+# Numbers the fixtures that need a key of their own (see Fixture.key)
+_fixture_ids = itertools.count()
+
+
+class FixtureError(ValueError):
+    """
+    Error that is raised when a fixture is declared with an invalid scope or
+    depends on a fixture with a narrower scope.
+    """
+    pass
+
+
+class Fixture:
+    """
+    A value built by fn from the values of the fixtures it depends on.
+    Fixtures can be passed in the args and kwargs of an ArgTest, where they
+    are replaced by their values when the test runs.
+    """
+
+    def __init__(self, fn, scope='test', depends=(), teardown=None,
+                 shared=False):
+        """
+        Arguments
+        ---------
+        fn (function (*dependency values) -> value) -- Builds the value. It
+            should be a module-level function so that multiprocessing workers
+            can find it.
+        scope (str) -- How long the value is cached: 'test', 'suite' or
+            'batch'.
+        depends (iterable of Fixture) -- The fixtures whose values are passed
+            to fn, in order.
+        teardown (function (value) -> None or None) -- Called with the value
+            when its scope ends.
+        shared (bool) -- Whether to build the value in the parent process and
+            share it with the multiprocessing workers through a memory-mapped
+            file (only for suite and batch scopes). Buffers like NumPy arrays
+            and bytearrays are mapped without being copied.
+        """
+        if scope not in FIXTURE_SCOPES:
+            raise FixtureError(
+                f"'{scope}' is not a valid fixture scope (expected one of "
+                f"{FIXTURE_SCOPES})."
+            )
+
+        self.fn = fn
+        self.scope = scope
+        self.depends = tuple(depends)
+        self.teardown = teardown
+        self.shared = shared and scope != 'test'
+        self.name = f"{fn.__module__}.{fn.__qualname__}"
+        self._key = None
+
+        for dependency in self.depends:
+            if _scope_level(dependency.scope) < _scope_level(scope):
+                raise FixtureError(
+                    f"The {scope} fixture {self!r} can't depend on the "
+                    f"{dependency.scope} fixture {dependency!r}."
+                )
+
+
+    def __repr__(self):
+        return self.fn.__name__
+
+
+    def _ref(self):
+        """
+        Returns an ObjectRef to this fixture if it was made by the decorator
+        (so it replaced its function in the module), or None.
+        """
+        from .descriptors import ObjectRef
+
+        ref = ObjectRef(self.fn.__module__, self.fn.__qualname__)
+        try:
+            return ref if ref.resolve() is self else None
+        except (ImportError, AttributeError):
+            return None
+
+
+    @property
+    def key(self):
+        """
+        The key of the fixture's value in a FixtureCache. A decorated
+        fixture is keyed by its name, which is the same in every process.
+        Other fixtures (like two lambdas, or one function wrapped twice) get
+        a key of their own, which is kept when they're pickled.
+        """
+        if self._key is None:
+            if self._ref() is not None:
+                self._key = self.name
+            else:
+                self._key = (self.name, os.getpid(), next(_fixture_ids))
+        return self._key
+
+
+    def __reduce__(self):
+        # A fixture made by the decorator is pickled as a reference to
+        # itself in its module
+        ref = self._ref()
+        if ref is not None:
+            return type(ref).resolve, (ref,)
+        return (Fixture, (self.fn, self.scope, self.depends, self.teardown,
+                          self.shared), {'_key': self.key})
+
+
+    def closure(self):
+        """
+        Returns this fixture and all of the fixtures it depends on.
+        """
+        fixtures = [self]
+        for dependency in self.depends:
+            fixtures += dependency.closure()
+        return fixtures
+
+
+def fixture(scope='test', depends=(), teardown=None, shared=False):
+    """
+    Decorator that turns a function into a Fixture, like
+
+        @fixture(scope='suite')
+        def big_graph():
+            return build_graph(10 ** 6)
+    """
+    def decorator(fn):
+        return Fixture(fn, scope, depends, teardown, shared)
+    return decorator
+
+
+def _scope_level(scope):
+    return FIXTURE_SCOPES.index(scope)
+
+
+class FixtureCache:
+    """
+    The values of the fixtures of one scope. Caches are chained from the
+    narrowest scope (a test) to the widest (the batch), and each value is
+    stored in the cache of its fixture's scope (or the narrowest cache if
+    there is none for that scope, like a suite fixture used by a test run on
+    its own). Values are torn down in the reverse order they were built.
+    """
+
+    def __init__(self, scope, parent=None):
+        if parent is None and scope != 'batch':
+            parent = _batch_cache
+
+        self.scope = scope
+        self.parent = parent
+        self.values = {}
+        self._teardowns = []
+
+
+    def _chain(self):
+        cache = self
+        while cache is not None:
+            yield cache
+            cache = cache.parent
+
+
+    def get(self, fixture):
+        """
+        Returns the value of fixture, building it (and the fixtures it depends
+        on) if it isn't cached yet.
+        """
+        for cache in self._chain():
+            if fixture.key in cache.values:
+                return cache.values[fixture.key]
+
+        owner = next((cache for cache in self._chain()
+                      if cache.scope == fixture.scope), self)
+
+        value = fixture.fn(*(self.get(dependency)
+                             for dependency in fixture.depends))
+        owner.values[fixture.key] = value
+        if fixture.teardown:
+            owner._teardowns.append((fixture.teardown, value))
+
+        return value
+
+
+    def inherited(self):
+        """
+        Returns a copy of this cache (in a forked process) with the values
+        but not the teardowns, which belong to the parent process.
+        """
+        cache = FixtureCache(self.scope, self.parent)
+        cache.values = dict(self.values)
+        return cache
+
+
+    def close(self):
+        """
+        Tears down the values in this cache.
+        """
+        teardowns, self._teardowns = self._teardowns, []
+        self.values = {}
+        for teardown, value in reversed(teardowns):
+            teardown(value)
+
+
+# The batch scope lasts as long as the process (see close_batch_fixtures)
+_batch_cache = FixtureCache('batch')
+
+# The suite scope of a multiprocessing worker (see worker_cache)
+_worker_cache = None
+
+
+def close_batch_fixtures():
+    """
+    Tears down the batch fixtures. Called at the end of a batch run.
+    """
+    _batch_cache.close()
+
+
+def worker_cache(shared):
+    """
+    Returns the suite cache of this multiprocessing worker, creating it on the
+    first call with the shared fixtures loaded from their files (a dict of
+    fixture key -> path). The cache is torn down when the worker exits.
+    """
+    global _worker_cache, _batch_cache
+    if _worker_cache is None:
+        import multiprocessing.util
+
+        _batch_cache = _batch_cache.inherited()
+        _worker_cache = FixtureCache('suite', _batch_cache)
+        for key, path in shared.items():
+            _worker_cache.values[key] = load_shared(path)
+
+        multiprocessing.util.Finalize(None, _close_worker, exitpriority=10)
+
+    return _worker_cache
+
+
+def _close_worker():
+    _worker_cache.close()
+    _batch_cache.close()
+
+
+# Segments in shared files are aligned for any buffer type
+_ALIGNMENT = 64
+
+
+def dump_shared(value):
+    """
+    Writes value to a temporary file that load_shared can memory-map, and
+    returns its path. The value is pickled with protocol 5 so that its
+    buffers are written as separate segments and mapped without copies.
+    """
+    import pickle
+    import struct
+    import tempfile
+
+    buffers = []
+    data = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+    segments = [memoryview(data)] + [buffer.raw() for buffer in buffers]
+
+    # The header is the number of segments and then their offsets and sizes
+    header_size = 8 + 16 * len(segments)
+    offsets = []
+    offset = header_size
+    for segment in segments:
+        offset += -offset % _ALIGNMENT
+        offsets.append(offset)
+        offset += segment.nbytes
+
+    fd, path = tempfile.mkstemp(prefix='autograder-fixture-',
+                                dir=memory_directory())
+    with os.fdopen(fd, 'wb') as f:
+        f.write(struct.pack('<Q', len(segments)))
+        for start, segment in zip(offsets, segments):
+            f.write(struct.pack('<QQ', start, segment.nbytes))
+        for start, segment in zip(offsets, segments):
+            f.seek(start)
+            f.write(segment)
+
+    return path
+
+
+def load_shared(path):
+    """
+    Memory-maps a file written by dump_shared and returns its value. Buffers
+    in the value are read-only views of the mapping.
+    """
+    import mmap
+    import pickle
+    import struct
+
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapped)
+    num_segments, = struct.unpack_from('<Q', view)
+    segments = []
+    for i in range(num_segments):
+        start, size = struct.unpack_from('<QQ', view, 8 + 16 * i)
+        segments.append(view[start:start + size])
+
+    return pickle.loads(segments[0], buffers=segments[1:])
@@ -0,0 +1,116 @@
+"""
+File: autograder/importcheck.py
+-------------------------------
+
+Checks that importing the autograder stays cheap. Heavy dependencies should
+only be loaded when the feature that needs them is used, since the import
+cost is paid by every grading process.
+
+Usage:
+    $ python -m autograder.importcheck [budget_ms]
+"""
+
+import subprocess
+import sys
+
+# Modules which must not be loaded by a plain import of the autograder.
+LAZY_MODULES = (
+    'cProfile',
+    'difflib',
+    'multiprocessing',
+    'pstats',
+    'py_compile',
+    'pycodestyle',
+    'traceback',
+    'tracemalloc',
+)
+
+# Modules a grading script imports before it does anything.
+ENTRY_POINTS = ('autograder', 'autograder.tests', 'autograder.testsuite')
+
+DEFAULT_BUDGET_MS = 50
+
+
+def _run(code, *flags):
+    """
+    Runs code in a fresh interpreter and returns its stdout and stderr.
+    """
+    result = subprocess.run(
+        [sys.executable, *flags, '-c', code],
+        capture_output=True, text=True, check=True
+    )
+    return result.stdout, result.stderr
+
+
+def eagerly_loaded():
+    """
+    Returns the modules in LAZY_MODULES that are loaded by importing the entry
+    points.
+    """
+    imports = '; '.join(f'import {module}' for module in ENTRY_POINTS)
+    stdout, _ = _run(
+        f"import sys; {imports}; "
+        f"print('\\n'.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    return stdout.split()
+
+
+def import_time_ms():
+    """
+    Returns the cumulative time to import the entry points in a fresh
+    interpreter, in milliseconds, as reported by -X importtime.
+    """
+    imports = '; '.join(f'import {module}' for module in ENTRY_POINTS)
+    _, stderr = _run(imports, '-X', 'importtime')
+
+    total_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            # The header line
+            continue
+
+        # Nested imports are indented, so only top-level imports of the
+        # autograder are counted (their cumulative time includes the rest)
+        if name.startswith(' autograder'):
+            total_us += int(cumulative)
+
+    return total_us / 1000
+
+
+def check(budget_ms=DEFAULT_BUDGET_MS):
+    """
+    Returns a list of problems with the import cost of the autograder.
+    """
+    problems = [f"'{module}' is imported eagerly."
+                for module in eagerly_loaded()]
+
+    # Take the best of a few runs to smooth out noise from the OS
+    elapsed = min(import_time_ms() for _ in range(3))
+    if elapsed > budget_ms:
+        problems.append(f"Importing the autograder took {elapsed:.1f}ms "
+                        f"(budget: {budget_ms}ms).")
+
+    return problems
+
+
+def main(argv):
+    from .printing import StatusMessage
+
+    budget_ms = float(argv[1]) if len(argv) > 1 else DEFAULT_BUDGET_MS
+    problems = check(budget_ms)
+
+    if not problems:
+        print(StatusMessage('Import cost is within budget.', 'success'))
+        return 0
+
+    for problem in problems:
+        print(StatusMessage(problem, 'fail'))
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,171 @@
+"""
+File: autograder/isolation.py
+-----------------------------
+
+Isolates the arguments of a test between calls, so that a function which
+mutates its arguments doesn't change the input seen by the next call.
+"""
+
+import copy
+import pickle
+
+from .structdiff import values_equal
+
+# Types whose values can't be mutated, so they can be shared between calls
+IMMUTABLE_TYPES = (int, float, complex, bool, str, bytes, type(None), range)
+
+
+def is_immutable(value):
+    """
+    Returns whether value (and everything in it) can't be mutated.
+    """
+    if isinstance(value, IMMUTABLE_TYPES):
+        return True
+    if type(value) in (tuple, frozenset):
+        return all(is_immutable(item) for item in value)
+    return False
+
+
+def _describe_position(key):
+    if isinstance(key, int):
+        return f"argument {key}"
+    return f"argument '{key}'"
+
+
+def _copyable(value):
+    """
+    Returns whether value can be pickled or deep-copied.
+    """
+    try:
+        pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return True
+    except Exception:
+        pass
+
+    try:
+        copy.deepcopy(value)
+        return True
+    except Exception:
+        return False
+
+
+class ArgSnapshot:
+    """
+    A snapshot of the arguments of a call which can be restored quickly for
+    each call. Immutable arguments are shared between calls. Mutable arguments
+    are serialized once with pickle and restored from that buffer, which is
+    much cheaper than a deepcopy for large fixtures; arguments which can't be
+    pickled are deep-copied instead. Arguments which can't be copied either
+    (like locks, modules or generators) are shared between calls, without
+    isolation or mutation detection.
+    """
+
+    def __init__(self, args, kwargs):
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs)
+
+        # Positions (ints for args, strs for kwargs) that need copying
+        self.positions = [i for i, arg in enumerate(self.args)
+                          if not is_immutable(arg)]
+        self.positions += [key for key, value in self.kwargs.items()
+                           if not is_immutable(value)]
+
+        # Positions of mutable arguments that can't be copied at all
+        self.shared = []
+
+        self.buffer = None
+        self.original = None
+        self.comparable = True
+        if not self.positions:
+            return
+
+        # Snapshot all of the mutable arguments together so that aliasing
+        # between them (like the same list passed twice) is preserved
+        if not self._snapshot():
+            self.shared = [key for key in self.positions
+                           if not _copyable(self._get(self.args, self.kwargs,
+                                                      key))]
+            self.positions = [key for key in self.positions
+                              if key not in self.shared]
+            if not self._snapshot():
+                self.shared += self.positions
+                self.positions = []
+            if not self.positions:
+                return
+
+        # Mutations can only be detected if copies compare equal
+        self.comparable = values_equal(self._copy(), self._copy())
+
+
+    def _snapshot(self):
+        """
+        Serializes (or else deep-copies) the arguments at self.positions and
+        returns whether that worked.
+        """
+        mutable = [self._get(self.args, self.kwargs, key)
+                   for key in self.positions]
+        try:
+            self.buffer = pickle.dumps(mutable, pickle.HIGHEST_PROTOCOL)
+            return True
+        except Exception:
+            pass
+
+        try:
+            self.original = copy.deepcopy(mutable)
+            return True
+        except Exception:
+            return False
+
+
+    @staticmethod
+    def _get(args, kwargs, key):
+        return args[key] if isinstance(key, int) else kwargs[key]
+
+
+    def _copy(self):
+        """
+        Returns a fresh copy of the mutable arguments.
+        """
+        if self.buffer is not None:
+            return pickle.loads(self.buffer)
+        return copy.deepcopy(self.original)
+
+
+    def restore(self):
+        """
+        Returns fresh copies of (args, kwargs) for one call.
+        """
+        if not self.positions:
+            return self.args, self.kwargs
+
+        args = list(self.args)
+        kwargs = dict(self.kwargs)
+        for key, value in zip(self.positions, self._copy()):
+            if isinstance(key, int):
+                args[key] = value
+            else:
+                kwargs[key] = value
+
+        return tuple(args), kwargs
+
+
+    def mutated(self, args, kwargs, expected=None):
+        """
+        Returns descriptions of the arguments of a call (made with a restored
+        copy) that were mutated during the call. If expected (the (args,
+        kwargs) of another call after it returned) is given, returns the
+        arguments that differ from those instead.
+        """
+        if not self.positions or not self.comparable:
+            return []
+
+        if expected is None:
+            originals = self._copy()
+        else:
+            originals = [self._get(*expected, key) for key in self.positions]
+
+        return [
+            _describe_position(key)
+            for key, original in zip(self.positions, originals)
+            if not values_equal(original, self._get(args, kwargs, key))
+        ]
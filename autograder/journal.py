@@ -0,0 +1,176 @@
+"""
+File: autograder/journal.py
+---------------------------
+
+Checkpoints batch grading runs in an append-only journal, so that a run which
+dies partway through can be restarted and skip the work that was already
+finished. Each line of the journal is a JSON record of either one test of a
+submission or a whole graded submission. Submissions are identified by the
+student and the hash of their file, so a changed submission is regraded. A
+partially written last line (left by a crash) is ignored.
+"""
+
+import json
+import os
+
+# The kinds of journal records
+TEST_RECORD = 'test'
+SUBMISSION_RECORD = 'submission'
+
+
+class Journal:
+    """
+    An append-only journal of the tests and submissions graded by a batch
+    run.
+    """
+
+    def __init__(self, path, sync=False):
+        """
+        Loads the records already in the journal at path (if it exists).
+
+        Arguments
+        ---------
+        path (str) -- The path of the journal file.
+        sync (bool) -- Whether to fsync the journal after every submission,
+            so that it survives the machine going down (not just the
+            process).
+        """
+        # Batch grading changes directories, so hold on to the full path
+        self.path = os.path.abspath(path)
+        self.sync = sync
+
+        # (student, sha, suite, index) -> (test name, passed, output)
+        self.tests = {}
+
+        # (student, sha) -> (report, import status, elapsed)
+        self.submissions = {}
+
+        self._file = None
+        self._load()
+
+
+    def _load(self):
+        try:
+            f = open(self.path, encoding='utf-8')
+        except FileNotFoundError:
+            return
+
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut off by a crash
+                    continue
+
+                key = (record['student'], record['sha'])
+                if record['kind'] == TEST_RECORD:
+                    self.tests[key + (record['suite'], record['index'])] = (
+                        record['name'], record['passed'], record['output']
+                    )
+                elif record['kind'] == SUBMISSION_RECORD:
+                    self.submissions[key] = (
+                        record['report'], record['import_status'],
+                        record['elapsed']
+                    )
+
+
+    def _append(self, record, sync=False):
+        """
+        Appends record to the journal and flushes it to the OS.
+        """
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+            # Don't glue the first record onto a line cut off by a crash
+            if self._file.tell() and not self._ends_with_newline():
+                self._file.write('\n')
+
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+
+    def submission(self, student, sha):
+        """
+        Returns the (report, import status, elapsed) of a graded submission,
+        or None if it hasn't been graded.
+        """
+        return self.submissions.get((student, sha))
+
+
+    def record_submission(self, student, sha, report, import_status,
+                          elapsed):
+        self.submissions[(student, sha)] = (report, import_status, elapsed)
+        self._append({
+            'kind': SUBMISSION_RECORD, 'student': student, 'sha': sha,
+            'report': report, 'import_status': import_status,
+            'elapsed': elapsed,
+        }, sync=self.sync)
+
+
+    def for_submission(self, student, sha):
+        """
+        Returns the SubmissionJournal that the test suites grading a
+        submission record their tests to.
+        """
+        return SubmissionJournal(self, student, sha)
+
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SubmissionJournal:
+    """
+    The part of a journal for one submission. Test suites are numbered in the
+    order they run, and each test is identified by its suite, its index in
+    the suite and its name.
+    """
+
+    def __init__(self, journal, student, sha):
+        self.journal = journal
+        self.student = student
+        self.sha = sha
+        self.num_suites = 0
+
+
+    def next_suite(self):
+        """
+        Returns the number of the next suite to run.
+        """
+        self.num_suites += 1
+        return self.num_suites - 1
+
+
+    def lookup(self, suite, index, name):
+        """
+        Returns the (passed, output) of a test that was already run, or None
+        if it wasn't (or if a different test was run in its place).
+        """
+        record = self.journal.tests.get(
+            (self.student, self.sha, suite, index)
+        )
+        if record is None or record[0] != name:
+            return None
+        return record[1], record[2]
+
+
+    def record(self, suite, index, name, passed, output):
+        self.journal.tests[(self.student, self.sha, suite, index)] = (
+            name, passed, output
+        )
+        self.journal._append({
+            'kind': TEST_RECORD, 'student': self.student, 'sha': self.sha,
+            'suite': suite, 'index': index, 'name': name, 'passed': passed,
+            'output': output,
+        })
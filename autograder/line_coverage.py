@@ -0,0 +1,301 @@
+"""
+File: autograder/line_coverage.py
+---------------------------------
+
+Records which lines of the student module each test runs. Only code objects
+from the student module are traced: with sys.monitoring (Python 3.12+) line
+events are enabled on those code objects alone and each line is disabled
+after its first hit, and otherwise a settrace hook that ignores every other
+frame is used. Lines are stored as bitsets (ints where bit n is set if line n
+ran) per file.
+"""
+
+import sys
+import types
+
+from .profiling import source_file
+
+# The sys.monitoring tool id (coverage tools are expected to use this one)
+_TOOL_ID = getattr(getattr(sys, 'monitoring', None), 'COVERAGE_ID', None)
+
+
+def _code_objects(module, filename):
+    """
+    Returns every code object defined in filename which is reachable from the
+    functions and classes of module, including nested functions and
+    comprehensions.
+    """
+    found = set()
+    stack = []
+
+    def add_object(obj, seen):
+        if id(obj) in seen:
+            return
+        seen.add(id(obj))
+
+        if isinstance(obj, (staticmethod, classmethod)):
+            obj = obj.__func__
+        if isinstance(obj, property):
+            for accessor in (obj.fget, obj.fset, obj.fdel):
+                if accessor is not None:
+                    add_object(accessor, seen)
+            return
+
+        code = getattr(obj, '__code__', None)
+        if code is not None:
+            stack.append(code)
+        elif isinstance(obj, type):
+            for value in vars(obj).values():
+                add_object(value, seen)
+
+    seen = set()
+    for value in vars(module).values():
+        add_object(value, seen)
+
+    while stack:
+        code = stack.pop()
+        if code in found or code.co_filename != filename:
+            continue
+        found.add(code)
+        stack.extend(const for const in code.co_consts
+                     if isinstance(const, types.CodeType))
+
+    return found
+
+
+def _line_numbers(code):
+    """
+    Returns the line numbers of the statements in code. The def line itself
+    is left out (unless it's the only line) since it never runs as part of
+    the call.
+    """
+    if hasattr(code, 'co_lines'):
+        lines = {line for _, _, line in code.co_lines() if line is not None}
+    else:
+        import dis
+        lines = {line for _, line in dis.findlinestarts(code)}
+
+    if len(lines) > 1:
+        lines.discard(code.co_firstlineno)
+    return lines
+
+
+def to_bitset(lines):
+    bits = 0
+    for line in lines:
+        bits |= 1 << line
+    return bits
+
+
+def from_bitset(bits):
+    """
+    Returns the sorted line numbers in a bitset.
+    """
+    lines = []
+    line = 0
+    while bits:
+        if bits & 1:
+            lines.append(line)
+        bits >>= 1
+        line += 1
+    return lines
+
+
+def _format_ranges(lines):
+    """
+    Formats sorted line numbers as ranges, like 3-5, 9.
+    """
+    ranges = []
+    for line in lines:
+        if ranges and ranges[-1][1] == line - 1:
+            ranges[-1][1] = line
+        else:
+            ranges.append([line, line])
+
+    return ', '.join(str(a) if a == b else f'{a}-{b}' for a, b in ranges)
+
+
+class CoverageCollector:
+    """
+    An opt-in collector of the student lines run by each test. The lines hit
+    by the calls of one test are returned by collect and the lines of all
+    tests are aggregated by merge.
+    """
+
+    def __init__(self):
+        # filename -> bitset of the lines hit by the current test
+        self.current = {}
+
+        # filename -> bitset of the lines hit by any test
+        self.hits = {}
+
+        # filename -> bitset of the lines that could have been hit
+        self.executable = {}
+
+        # filename -> code objects traced in that file
+        self._codes = {}
+
+
+    def empty_copy(self):
+        """
+        Returns a new collector with no data.
+        """
+        return CoverageCollector()
+
+
+    def _codes_for(self, fn, filename):
+        """
+        Finds (and caches) the code objects of the module fn belongs to.
+        """
+        if filename not in self._codes:
+            module = sys.modules.get(getattr(fn, '__module__', None))
+            codes = _code_objects(module, filename) if module else set()
+
+            code = getattr(fn, '__code__', None)
+            if code is not None and code.co_filename == filename:
+                codes |= _code_objects(types.SimpleNamespace(fn=fn), filename)
+
+            self._codes[filename] = codes
+            self.executable[filename] = to_bitset(
+                line for code in codes for line in _line_numbers(code)
+            )
+
+        return self._codes[filename]
+
+
+    def call(self, fn, args, kwargs, through=None):
+        """
+        Calls fn(*args, **kwargs) while recording the lines hit in fn's file
+        and returns its output.
+
+        Arguments
+        ---------
+        through (Profiler or None) -- Another tracer to make the call through.
+        """
+        filename = source_file(fn)
+        call = through.call if through else (
+            lambda fn, args, kwargs: fn(*args, **kwargs)
+        )
+
+        if filename is None:
+            return call(fn, args, kwargs)
+
+        codes = self._codes_for(fn, filename)
+        if _TOOL_ID is not None and sys.monitoring.get_tool(_TOOL_ID) is None:
+            return self._call_monitored(call, fn, args, kwargs, filename,
+                                        codes)
+
+        return self._call_traced(call, fn, args, kwargs, filename, codes)
+
+
+    def _call_monitored(self, call, fn, args, kwargs, filename, codes):
+        """
+        Records lines with sys.monitoring line events on the student code
+        objects only. Only used when no other coverage tool (like coverage.py)
+        holds the coverage tool id.
+        """
+        monitoring = sys.monitoring
+        lines = set()
+
+        def on_line(code, line):
+            lines.add(line)
+            # Each line only needs to be seen once per test
+            return monitoring.DISABLE
+
+        monitoring.use_tool_id(_TOOL_ID, 'autograder')
+        try:
+            monitoring.register_callback(_TOOL_ID, monitoring.events.LINE,
+                                         on_line)
+            for code in codes:
+                monitoring.set_local_events(_TOOL_ID, code,
+                                            monitoring.events.LINE)
+            # Re-enable the lines disabled during previous tests
+            monitoring.restart_events()
+
+            return call(fn, args, kwargs)
+
+        finally:
+            for code in codes:
+                monitoring.set_local_events(_TOOL_ID, code, 0)
+            monitoring.register_callback(_TOOL_ID, monitoring.events.LINE,
+                                         None)
+            monitoring.free_tool_id(_TOOL_ID)
+            self._record(filename, lines)
+
+
+    def _call_traced(self, call, fn, args, kwargs, filename, codes):
+        """
+        Records lines with a settrace hook which only traces frames running
+        the student code objects.
+        """
+        lines = set()
+
+        def trace_lines(frame, event, arg):
+            if event == 'line':
+                lines.add(frame.f_lineno)
+            return trace_lines
+
+        def trace_calls(frame, event, arg):
+            if frame.f_code in codes:
+                return trace_lines
+            return None
+
+        old_trace = sys.gettrace()
+        sys.settrace(trace_calls)
+        try:
+            return call(fn, args, kwargs)
+
+        finally:
+            sys.settrace(old_trace)
+            self._record(filename, lines)
+
+
+    def _record(self, filename, lines):
+        self.current[filename] = (self.current.get(filename, 0)
+                                  | to_bitset(lines))
+
+
+    def collect(self):
+        """
+        Returns and clears the bitsets of the lines hit by the current test,
+        along with the bitsets of the executable lines.
+        """
+        data = (self.current, dict(self.executable))
+        self.current = {}
+        return data
+
+
+    def merge(self, current, executable):
+        """
+        Adds the lines hit by a test (as returned by collect) to the
+        aggregate.
+        """
+        for filename, bits in current.items():
+            self.hits[filename] = self.hits.get(filename, 0) | bits
+        for filename, bits in executable.items():
+            self.executable[filename] = (self.executable.get(filename, 0)
+                                         | bits)
+
+
+    def report(self):
+        """
+        Returns a report of the lines of student code the tests ran.
+        """
+        if not self.executable:
+            return 'No student code was run.'
+
+        lines = []
+        for filename, executable in sorted(self.executable.items()):
+            hit = self.hits.get(filename, 0) & executable
+            num_hit = bin(hit).count('1')
+            num_lines = bin(executable).count('1')
+            percent = 100 * num_hit / num_lines if num_lines else 100
+
+            lines.append(f"{filename}: {percent:.0f}% of lines run "
+                         f"({num_hit}/{num_lines})")
+
+            missed = from_bitset(executable & ~hit)
+            if missed:
+                lines.append(f"  Lines never run: {_format_ranges(missed)}")
+
+        return '\n'.join(lines)
@@ -0,0 +1,307 @@
+"""
+File: autograder/loading.py
+---------------------------
+
+Imports student modules with a time and memory budget, so that top-level code
+which loops forever, allocates huge amounts of memory or waits for input can't
+stall the autograder.
+"""
+
+import collections
+import contextlib
+import importlib
+import io
+import sys
+import time
+
+from .io_utils import BufferFalloffError, RedirectStdin
+
+ImportResult = collections.namedtuple(
+    'ImportResult', ('module', 'status', 'stdout', 'stderr', 'error',
+                     'elapsed')
+)
+
+# The statuses of an ImportResult
+IMPORT_OK = 'ok'
+IMPORT_FAILED = 'failed'
+IMPORT_TIMED_OUT = 'timed out'
+IMPORT_OUT_OF_MEMORY = 'out of memory'
+
+
+class ImportTimeout(BaseException):
+    """
+    Error that is raised inside the import when it runs out of time. It isn't
+    an Exception so that student code can't accidentally catch it.
+    """
+    pass
+
+
+@contextlib.contextmanager
+def time_limit(seconds, error=ImportTimeout):
+    """
+    Raises error (an exception class) in the main thread after seconds. Only
+    supported on platforms with SIGALRM; elsewhere (or off the main thread)
+    the time isn't limited.
+    """
+    import signal
+    import threading
+
+    supported = (hasattr(signal, 'SIGALRM')
+                 and threading.current_thread() is threading.main_thread())
+    if not seconds or not supported:
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise error()
+
+    old_handler = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, old_handler)
+
+
+def _address_space():
+    """
+    Returns the current size of the process's address space in bytes, or None
+    if it can't be found.
+    """
+    import resource
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@contextlib.contextmanager
+def _memory_limit(num_bytes):
+    """
+    Limits the process to num_bytes more memory than it currently uses, so
+    that allocations beyond the budget raise MemoryError. Only supported on
+    platforms with the resource module and /proc.
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    current = _address_space() if num_bytes and resource else None
+    if current is None:
+        yield
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = current + num_bytes
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _import_captured(module_name, timeout=None, memory_limit=None,
+                     reload=False):
+    """
+    Imports module_name in this process (or reloads it, if reload is True and
+    it's already imported) with its printing captured, an empty stdin and the
+    time and memory budgets enforced here (where supported).
+
+    Returns
+    -------
+    tuple -- The module (or None), the status, the captured stdout and
+        stderr and a description of the error (or None).
+    """
+    __old_stdout = sys.stdout
+    __old_stderr = sys.stderr
+    __old_stdin = sys.stdin
+
+    f_stdout = io.StringIO()
+    f_stderr = io.StringIO()
+
+    module, error = None, None
+    status = IMPORT_FAILED
+
+    try:
+        sys.stdout = f_stdout
+        sys.stderr = f_stderr
+        sys.stdin = RedirectStdin()
+
+        with time_limit(timeout), _memory_limit(memory_limit):
+            if reload and module_name in sys.modules:
+                module = importlib.reload(sys.modules[module_name])
+            else:
+                module = importlib.import_module(module_name)
+        status = IMPORT_OK
+
+    except ImportTimeout:
+        status = IMPORT_TIMED_OUT
+        error = f"Importing the module took more than {timeout} seconds."
+
+    except MemoryError:
+        status = IMPORT_OUT_OF_MEMORY
+        error = (f"Importing the module used more than {memory_limit} bytes "
+                 f"of memory.")
+
+    except BufferFalloffError:
+        error = "The module tried to read input when it was imported."
+
+    except SystemExit:
+        error = ("The module tried to exit the Python process when it was "
+                 "imported.")
+
+    except Exception as e:
+        import traceback
+        error = f"Threw {e}.\n{traceback.format_exc()}"
+
+    finally:
+        sys.stdout = __old_stdout
+        sys.stderr = __old_stderr
+        sys.stdin = __old_stdin
+
+    if status != IMPORT_OK:
+        # Don't leave a half-initialized module behind
+        sys.modules.pop(module_name, None)
+
+    return module, status, f_stdout.getvalue(), f_stderr.getvalue(), error
+
+
+def _probe(module_name, memory_limit, reload, conn):
+    """
+    Imports module_name in a child process under the memory budget and sends
+    back everything but the module.
+    """
+    conn.send(_import_captured(module_name, memory_limit=memory_limit,
+                               reload=reload)[1:])
+    conn.close()
+
+
+def _probe_in_child(module_name, timeout, memory_limit, reload=False):
+    """
+    Imports module_name in a forked child process, which is killed if it
+    takes longer than timeout, so that neither the time limit nor the memory
+    limit touch this process.
+
+    Returns
+    -------
+    tuple or None -- The status, stdout, stderr and error of the import in
+        the child, or None if child processes can't be forked here.
+    """
+    import multiprocessing as mp
+
+    if 'fork' not in mp.get_all_start_methods():
+        return None
+
+    context = mp.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_probe,
+                              args=(module_name, memory_limit, reload,
+                                    sender),
+                              daemon=True)
+    process.start()
+    sender.close()
+
+    try:
+        if receiver.poll(timeout):
+            return receiver.recv()
+    except EOFError:
+        # The child died without sending anything back
+        pass
+    finally:
+        timed_out = process.is_alive()
+        process.kill()
+        process.join()
+        receiver.close()
+
+    if timed_out:
+        return (IMPORT_TIMED_OUT, '', '',
+                f"Importing the module took more than {timeout} seconds.")
+
+    return (IMPORT_FAILED, '', '',
+            f"Importing the module crashed the process (exit code "
+            f"{process.exitcode}).")
+
+
+def guarded_import(module_name, timeout=None, memory_limit=None,
+                   probe=False, reload=False):
+    """
+    Imports module_name with its printing captured, an empty stdin and
+    optional time and memory budgets, which are enforced in this process
+    with SIGALRM and resource.setrlimit (a warning is given where they can't
+    be). The module's top-level code runs once.
+
+    If probe is True and processes can be forked, the module is first
+    imported in a child process that is killed when it runs out of time
+    (even in a C-level loop, which SIGALRM can't interrupt) and which alone
+    carries the memory limit. The module is then only imported here if that
+    import succeeds, so its top-level code runs twice.
+
+    Arguments
+    ---------
+    module_name (str) -- The name of the module to import.
+    timeout (float or None) -- The number of seconds the import may take.
+    memory_limit (int or None) -- The number of bytes of memory the import may
+        allocate.
+    probe (bool) -- Whether to try the import in a child process first.
+    reload (bool) -- Whether to reload the module if it's already imported.
+
+    Returns
+    -------
+    ImportResult -- The module (or None if the import didn't succeed), the
+        status, the captured stdout and stderr, a description of the error
+        (or None) and the number of seconds the import took.
+    """
+    start = time.perf_counter()
+
+    probed = None
+    if probe and (timeout or memory_limit):
+        probed = _probe_in_child(module_name, timeout, memory_limit, reload)
+
+    if probed is None:
+        _warn_unenforced(timeout, memory_limit)
+        module, *result = _import_captured(module_name, timeout, memory_limit,
+                                           reload)
+
+    elif probed[0] != IMPORT_OK:
+        module, result = None, probed
+
+    else:
+        # The child already enforced the budgets, so the time limit here is
+        # only a fallback for imports that don't behave the same twice
+        module, *result = _import_captured(module_name, timeout,
+                                           reload=reload)
+
+    return ImportResult(module, *result, time.perf_counter() - start)
+
+
+def _warn_unenforced(timeout, memory_limit):
+    """
+    Warns about budgets that can't be enforced in this process.
+    """
+    import signal
+    import threading
+    import warnings
+
+    if timeout and not (hasattr(signal, 'SIGALRM')
+                        and threading.current_thread()
+                        is threading.main_thread()):
+        warnings.warn("The import time limit can't be enforced here (it "
+                      "needs SIGALRM on the main thread, or a probe in a "
+                      "forked child process).",
+                      RuntimeWarning, stacklevel=3)
+
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    if memory_limit and (resource is None or _address_space() is None):
+        warnings.warn("The import memory limit can't be enforced on this "
+                      "platform.", RuntimeWarning, stacklevel=3)
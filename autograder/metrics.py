@@ -0,0 +1,430 @@
+"""
+File: autograder/metrics.py
+---------------------------
+
+Counters and histograms of what a grading run is doing (tests run and their
+outcomes, how long each phase takes, how busy the multiprocessing workers are
+and how many tests are queued for them), exported in the OpenMetrics text
+format to a file or a local HTTP endpoint so a scraper like Prometheus can
+graph them.
+
+Metrics are recorded into the MetricsRegistry passed to a TestSuite or
+BatchGrader, or into the registry of a recording() context. Multiprocessing
+workers record into their own registries, which are merged into the parent's
+with the results of each chunk.
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+# The upper bounds of the buckets of latency histograms, in seconds
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0,
+                   5.0, 10.0, 30.0)
+
+# The upper bounds of the buckets of the queue depth histogram
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# The content type of the OpenMetrics text format
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+def _escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return f'{{{pairs}}}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A family of samples with the same name, one for each combination of
+    label values.
+    """
+    kind = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+        # Tuple of (label name, value) pairs -> value
+        self.values = {}
+
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} takes the labels {self.labelnames} (got "
+                f"{tuple(labels)})."
+            )
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+
+    def _samples(self):
+        """
+        Yields the (suffix, labels, value) of each sample.
+        """
+        raise NotImplementedError
+
+
+    def render(self):
+        lines = [f'# TYPE {self.name} {self.kind}',
+                 f'# HELP {self.name} {_escape(self.help)}']
+        for suffix, labels, value in self._samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(labels)} '
+                         f'{_format_number(value)}')
+        return lines
+
+
+class Counter(Metric):
+    """
+    A count that only goes up, like the number of tests run.
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+    def _merge(self, values):
+        for key, value in values.items():
+            self.values[key] = self.values.get(key, 0) + value
+
+
+    def _samples(self):
+        for key, value in self.values.items():
+            yield '_total', key, value
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down, like the depth of a queue.
+    """
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = value
+
+
+    def _merge(self, values):
+        self.values.update(values)
+
+
+    def _samples(self):
+        for key, value in self.values.items():
+            yield '', key, value
+
+
+class Histogram(Metric):
+    """
+    The distribution of observed values (like latencies) in buckets.
+    """
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            state = self.values.get(key)
+            if state is None:
+                # The count in each bucket (not cumulative), the count of all
+                # of the values and their sum
+                state = self.values[key] = [[0] * len(self.buckets), 0, 0.0]
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+
+    def _merge(self, values):
+        for key, (counts, count, total) in values.items():
+            state = self.values.setdefault(
+                key, [[0] * len(self.buckets), 0, 0.0]
+            )
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += count
+            state[2] += total
+
+
+    def _samples(self):
+        for key, (counts, count, total) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield '_bucket', key + (('le', repr(float(bound))),), \
+                    cumulative
+            yield '_bucket', key + (('le', '+Inf'),), count
+            yield '_count', key, count
+            yield '_sum', key, total
+
+
+class MetricsRegistry:
+    """
+    The metrics of a grading run.
+    """
+
+    def __init__(self, path=None):
+        """
+        Arguments
+        ---------
+        path (str or None) -- The file to write the metrics to in the
+            OpenMetrics text format whenever a suite or batch graded
+            submission finishes (see flush), for scrapers that read files.
+        """
+        self.path = path and os.path.abspath(path)
+        self.lock = threading.RLock()
+        self.metrics = {}
+        self._server = None
+
+        self.tests = self.counter(
+            'autograder_tests', 'Tests run, by outcome.', ('outcome',)
+        )
+        self.test_seconds = self.histogram(
+            'autograder_test_seconds', 'Time taken to run each test.'
+        )
+        self.phase_seconds = self.histogram(
+            'autograder_phase_seconds',
+            'Time taken by each phase of grading (calls of the student and '
+            'solution code, diffing, style checking and importing).',
+            ('phase',)
+        )
+        self.imports = self.counter(
+            'autograder_imports', 'Imports of student modules, by status.',
+            ('status',)
+        )
+        self.submissions = self.counter(
+            'autograder_submissions',
+            'Submissions graded in batch runs, by whether they were graded or '
+            'taken from the journal.', ('source',)
+        )
+        self.submission_seconds = self.histogram(
+            'autograder_submission_seconds',
+            'Time taken to grade each submission.'
+        )
+        self.worker_busy_seconds = self.counter(
+            'autograder_worker_busy_seconds',
+            'Time the multiprocessing workers spent running tests.'
+        )
+        self.worker_utilization = self.gauge(
+            'autograder_worker_utilization',
+            'Fraction of the multiprocessing pool that was busy while the '
+            'last suite ran.'
+        )
+        self.queue_depth = self.gauge(
+            'autograder_queue_depth',
+            'Tests sent to the multiprocessing workers that haven\'t '
+            'returned.'
+        )
+        self.queue_depth_samples = self.histogram(
+            'autograder_queue_depth_samples',
+            'Depth of the multiprocessing queue each time it changed.',
+            buckets=DEPTH_BUCKETS
+        )
+
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(self, name, help, labelnames))
+
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(self, name, help, labelnames))
+
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self, name, help, labelnames, buckets))
+
+
+    def observe_test(self, test, passed, elapsed):
+        """
+        Records the outcome and duration of a test that ran. Tests that
+        failed because the student code ran out of time (like a FuzzTest call
+        over its call_timeout, or a PerformanceTest over its max_time) are
+        counted as timed_out.
+        """
+        if passed:
+            outcome = 'passed'
+        elif getattr(test, 'timed_out', False):
+            outcome = 'timed_out'
+        elif getattr(getattr(test, 'student_response', None), 'error', None):
+            outcome = 'errored'
+        else:
+            outcome = 'failed'
+
+        self.tests.inc(outcome=outcome)
+        self.test_seconds.observe(elapsed)
+
+
+    def collect(self):
+        """
+        Returns the values of the counters and histograms (a picklable dict of
+        metric name -> values) and resets them. Used by the workers to send
+        their metrics to the parent process.
+        """
+        with self.lock:
+            collected = {}
+            for name, metric in self.metrics.items():
+                if metric.values and not isinstance(metric, Gauge):
+                    collected[name] = metric.values
+                    metric.values = {}
+            return collected
+
+
+    def merge(self, collected):
+        """
+        Adds the values returned by the collect of another registry.
+        """
+        with self.lock:
+            for name, values in collected.items():
+                self.metrics[name]._merge(values)
+
+
+    def render(self):
+        """
+        Returns the metrics in the OpenMetrics text format.
+        """
+        with self.lock:
+            lines = []
+            for metric in self.metrics.values():
+                lines += metric.render()
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+    def write(self, path):
+        """
+        Writes the metrics to path. The file is replaced in one step, so a
+        scraper never reads it half written.
+        """
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+
+    def flush(self):
+        """
+        Writes the metrics to the path given in __init__, if any.
+        """
+        if self.path:
+            self.write(self.path)
+
+
+    def serve(self, port=9464, host='127.0.0.1'):
+        """
+        Serves the metrics at http://host:port/metrics from a background
+        thread until stop is called, and returns the address it's serving on
+        (pass port 0 to pick a free port).
+        """
+        import http.server
+
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                # Don't mix request logs into the grading output
+                pass
+
+        self.stop()
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+        return self._server.server_address
+
+
+    def stop(self):
+        """
+        Stops serving the metrics.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# The registry that tests record into (see recording)
+_active = None
+
+
+def active():
+    """
+    Returns the registry being recorded into, or None.
+    """
+    return _active
+
+
+@contextlib.contextmanager
+def recording(registry):
+    """
+    Within the context, the tests, phases and suites that run are recorded
+    into registry.
+    """
+    global _active
+    old_registry = _active
+    _active = registry
+    try:
+        yield registry
+    finally:
+        _active = old_registry
+
+
+@contextlib.contextmanager
+def timed(phase):
+    """
+    Records how long the context took as a phase of grading, if a registry is
+    being recorded into.
+    """
+    registry = _active
+    if registry is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.phase_seconds.observe(time.perf_counter() - start,
+                                       phase=phase)
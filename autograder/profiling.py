@@ -0,0 +1,416 @@
+"""
+File: autograder/profiling.py
+-----------------------------
+
+Collects profiles of student code while it is being tested and attributes
+the time to functions in the student module.
+"""
+
+import collections
+import os
+import sys
+import threading
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+
+def source_file(fn):
+    """
+    Returns the file that fn was defined in, or None if it can't be found.
+    """
+    code = getattr(fn, '__code__', None)
+    if code is None:
+        code = getattr(getattr(fn, '__call__', None), '__code__', None)
+    if code is None:
+        module = sys.modules.get(getattr(fn, '__module__', None))
+        return getattr(module, '__file__', None)
+
+    return code.co_filename
+
+
+class _SampledCall:
+    """
+    The samples of one call of student code in 'sample' mode.
+    """
+
+    def __init__(self, target, filename, interval):
+        import time
+
+        self.target = target
+        self.filename = filename
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.seconds = collections.Counter()
+        self.last = time.perf_counter()
+
+
+    def sample(self, now):
+        """
+        Records the student frames on the stack of the calling thread.
+        """
+        frame = sys._current_frames().get(self.target)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename == self.filename:
+                stack.append((code.co_filename, code.co_firstlineno,
+                              code.co_name))
+            frame = frame.f_back
+
+        # Weight the sample by the time since the last one, since the
+        # sampler may be starved of the GIL
+        if stack:
+            stack = tuple(reversed(stack))
+            self.counts[stack] += 1
+            self.seconds[stack] += now - self.last
+        self.last = now
+
+
+class _Sampler:
+    """
+    The sampling thread of this process. It's started once and samples
+    whichever call is active, so short calls don't pay for starting a thread
+    (and waiting for it to get the GIL) each time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.active = None
+        self.thread = None
+        self.old_switch_interval = None
+
+
+    def start(self, call):
+        """
+        Starts sampling call. The interpreter's switch interval is lowered so
+        that the sampler gets the GIL about as often as it asks for it.
+        """
+        self.old_switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.old_switch_interval,
+                                  call.interval / 4))
+
+        with self.lock:
+            self.active = call
+
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        self.wakeup.set()
+
+
+    def stop(self):
+        with self.lock:
+            self.active = None
+        sys.setswitchinterval(self.old_switch_interval)
+
+
+    def _run(self):
+        import time
+
+        while True:
+            call = self.active
+            if call is None:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+
+            time.sleep(call.interval)
+            with self.lock:
+                if self.active is call:
+                    call.sample(time.perf_counter())
+
+
+_sampler = _Sampler()
+
+
+def _label(func):
+    """
+    Builds a readable label from a pstats function key (file, line, name).
+    """
+    filename, line, name = func
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+class Profiler:
+    """
+    An opt-in profiler for the student code run by the tests. Each call is
+    profiled separately, restricted to frames from the student's source file
+    and added to a profile that is aggregated across the suite.
+    """
+
+    def __init__(self, mode='cprofile', interval=0.001, top=20):
+        """
+        Initializes the profiler.
+
+        Arguments
+        ---------
+        mode (str) -- Either 'cprofile' (deterministic, exact call counts) or
+            'sample' (statistical, lower overhead).
+        interval (float) -- The time between samples in 'sample' mode, in
+            seconds.
+        top (int) -- The number of functions to show in the report.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(
+                f"'{mode}' is not a valid profiling mode (expected one of "
+                f"{', '.join(PROFILE_MODES)})."
+            )
+
+        self.mode = mode
+        self.interval = interval
+        self.top = top
+
+        # pstats-style entries: (file, line, name) -> (cc, nc, tt, ct, callers)
+        self.stats = {}
+
+        # Sampled stacks (root-to-leaf tuples) -> seconds
+        self.stacks = collections.Counter()
+
+        # The number of sampled calls and how many of them got no samples
+        self.calls = 0
+        self.unsampled_calls = 0
+
+
+    def empty_copy(self):
+        """
+        Returns a new profiler with the same settings and no data.
+        """
+        return Profiler(self.mode, self.interval, self.top)
+
+
+    def call(self, fn, args, kwargs):
+        """
+        Calls fn(*args, **kwargs) under the profiler and returns its output.
+        """
+        filename = source_file(fn)
+        if filename is None:
+            return fn(*args, **kwargs)
+
+        if self.mode == 'cprofile':
+            return self._call_cprofile(fn, args, kwargs, filename)
+
+        return self._call_sampled(fn, args, kwargs, filename)
+
+
+    def _call_cprofile(self, fn, args, kwargs, filename):
+        """
+        Profiles the call deterministically with cProfile.
+        """
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(fn, *args, **kwargs)
+
+        finally:
+            profile.create_stats()
+            self.merge(self._restrict(profile.stats, filename), None)
+
+
+    def _call_sampled(self, fn, args, kwargs, filename):
+        """
+        Profiles the call by sampling the calling thread's stack from the
+        process's sampler thread.
+        """
+        call = _SampledCall(threading.get_ident(), filename, self.interval)
+        _sampler.start(call)
+        try:
+            return fn(*args, **kwargs)
+
+        finally:
+            _sampler.stop()
+            self.merge(self._stats_from_samples(call.counts, call.seconds),
+                       call.seconds, (1, 0 if call.counts else 1))
+
+
+    @staticmethod
+    def _restrict(stats, filename):
+        """
+        Drops every pstats entry that isn't from filename. Calls that went
+        through other code (like a builtin calling a student generator) are
+        attributed to the nearest caller from filename.
+        """
+        def student_callers(func, seen):
+            for caller, value in stats.get(func, (0, 0, 0, 0, {}))[4].items():
+                if caller[0] == filename:
+                    yield caller
+                elif caller not in seen:
+                    yield from student_callers(caller, seen | {caller})
+
+        restricted = {}
+        for func, (cc, nc, tt, ct, callers) in stats.items():
+            if func[0] != filename:
+                continue
+
+            student = {}
+            for caller, value in callers.items():
+                if caller[0] == filename:
+                    targets = [caller]
+                else:
+                    targets = set(student_callers(caller, frozenset([caller])))
+
+                for target in targets:
+                    if target in student:
+                        value = tuple(i + j for i, j in
+                                      zip(student[target], value))
+                    student[target] = value
+
+            restricted[func] = (cc, nc, tt, ct, student)
+
+        return restricted
+
+
+    @staticmethod
+    def _stats_from_samples(counts, seconds):
+        """
+        Converts sampled stacks into pstats-style entries. Call counts are the
+        number of samples in which a function was on top of the stack.
+        """
+        stats = {}
+        for stack, count in counts.items():
+            elapsed = seconds[stack]
+            for depth, func in enumerate(stack):
+                cc, nc, tt, ct, callers = stats.get(func, (0, 0, 0, 0, {}))
+                if func not in stack[:depth]:
+                    ct += elapsed
+                if depth == len(stack) - 1:
+                    nc += count
+                    tt += elapsed
+                if depth:
+                    caller = stack[depth - 1]
+                    callers[caller] = callers.get(caller, 0) + count
+                stats[func] = (nc, nc, tt, ct, callers)
+
+        return stats
+
+
+    def merge(self, stats, stacks, calls=(0, 0)):
+        """
+        Adds a restricted profile (as returned by collect) to the aggregate.
+        calls is the number of sampled calls and how many got no samples.
+        """
+        import pstats
+
+        for func, entry in stats.items():
+            if func in self.stats:
+                entry = pstats.add_func_stats(self.stats[func], entry)
+            self.stats[func] = entry
+
+        if stacks:
+            for stack, count in stacks.items():
+                self.stacks[stack] += count
+
+        self.calls += calls[0]
+        self.unsampled_calls += calls[1]
+
+
+    def collect(self):
+        """
+        Returns and clears the profile collected so far as picklable data so
+        that it can be sent from a worker process and merged in the parent.
+        """
+        data = (self.stats, self.stacks, (self.calls, self.unsampled_calls))
+        self.stats = {}
+        self.stacks = collections.Counter()
+        self.calls = 0
+        self.unsampled_calls = 0
+        return data
+
+
+    def _collapsed_stacks(self):
+        """
+        Returns collapsed stacks (root-to-leaf tuples) weighted in
+        microseconds of self time. Sampled stacks are used directly; for
+        cProfile data the stacks are reconstructed from the caller graph.
+        """
+        if self.stacks:
+            return {stack: int(elapsed * 1e6)
+                    for stack, elapsed in self.stacks.items()}
+
+        collapsed = collections.Counter()
+
+        def paths(func, weight, seen):
+            callers = {caller: value
+                       for caller, value in self.stats[func][4].items()
+                       if caller in self.stats and caller not in seen}
+            total = sum(value[0] for value in callers.values())
+
+            if not total or len(seen) >= 64:
+                yield (func,), weight
+                return
+
+            for caller, value in callers.items():
+                share = weight * value[0] / total
+                for path, path_weight in paths(caller, share, seen | {func}):
+                    yield path + (func,), path_weight
+
+        for func, (cc, nc, tt, ct, callers) in self.stats.items():
+            for path, weight in paths(func, tt, frozenset()):
+                collapsed[path] += weight
+
+        return {stack: int(weight * 1e6)
+                for stack, weight in collapsed.items() if weight * 1e6 >= 1}
+
+
+    def report(self, top=None):
+        """
+        Returns a report of the functions in the student code with the most
+        time spent in them.
+        """
+        top = top or self.top
+        unsampled = ''
+        if self.unsampled_calls:
+            unsampled = (f"{self.unsampled_calls} of {self.calls} calls of "
+                         f"the student code ended before they could be "
+                         f"sampled (every {self.interval}s).")
+
+        if not self.stats:
+            return unsampled or 'No time was spent in the student code.'
+
+        ranked = sorted(self.stats.items(), key=lambda item: item[1][2],
+                        reverse=True)[:top]
+        total = sum(entry[2] for entry in self.stats.values()) or 1
+
+        unit = 'ncalls' if self.mode == 'cprofile' else 'samples'
+        lines = [f"{unit:>10} {'tottime':>10} {'cumtime':>10} {'%':>6}  "
+                 f"function"]
+        for func, (cc, nc, tt, ct, callers) in ranked:
+            lines.append(f"{nc:>10} {tt:>10.4f} {ct:>10.4f} "
+                         f"{100 * tt / total:>6.1f}  {_label(func)}")
+        if unsampled:
+            lines.append(unsampled)
+
+        return '\n'.join(lines)
+
+
+    def dump_stats(self, filename):
+        """
+        Writes the aggregated profile to filename in the pstats format.
+        """
+        import pstats
+
+        stats = pstats.Stats()
+        stats.stats = self.stats
+        stats.dump_stats(filename)
+
+
+    def dump_collapsed(self, filename):
+        """
+        Writes the aggregated profile to filename as collapsed stacks, which
+        can be rendered by flame graph tools.
+        """
+        with open(filename, 'w') as f:
+            for stack, weight in sorted(self._collapsed_stacks().items()):
+                labels = ';'.join(_label(func) for func in stack)
+                f.write(f"{labels} {weight}\n")
+
+
+    def dump(self, prefix):
+        """
+        Writes prefix.collapsed and, for cProfile data, prefix.pstats.
+        """
+        if self.mode == 'cprofile':
+            self.dump_stats(prefix + '.pstats')
+
+        self.dump_collapsed(prefix + '.collapsed')
@@ -0,0 +1,243 @@
+"""
+File: autograder/scratch.py
+---------------------------
+
+Scratch directories give tests their own working directory, so that tests
+which create files (or student code which writes output files) can run in
+parallel without racing on one shared cwd. Scratch directories are created in
+memory (/dev/shm) where possible. Common input files are copied once per run,
+made read-only and symlinked into every scratch directory, while files that
+tests may write are copied into each one.
+"""
+
+import contextlib
+import os
+import sys
+
+# How long a scratch directory is kept: for all the tests run by a process
+# (or worker), or for a single test
+SCRATCH_SCOPES = ('worker', 'test')
+
+
+def memory_directory():
+    """
+    Returns a directory in memory (so files written there never hit the disk)
+    if there is one, or None for the default temporary directory.
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+
+def absolute_sys_path():
+    """
+    Makes the relative entries of sys.path (like '' for the current
+    directory) absolute, so that imports keep finding the same modules after
+    changing directories.
+    """
+    sys.path[:] = [os.path.abspath(entry) for entry in sys.path]
+
+
+# The ioctl that clones a file's extents on Linux (copy-on-write file systems
+# like btrfs and XFS)
+_FICLONE = 0x40049409
+
+
+def _copy_file(source, target):
+    """
+    Copies source to target, sharing the data with a reflink where the file
+    system supports it and copying it otherwise.
+    """
+    import shutil
+
+    try:
+        import fcntl
+
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        shutil.copystat(source, target)
+        return
+    except (ImportError, OSError):
+        pass
+
+    shutil.copy2(source, target)
+
+
+def _copy(source, target):
+    """
+    Copies the file or directory source to target, so that writes to the copy
+    never reach the original.
+    """
+    import shutil
+
+    if os.path.isdir(source):
+        shutil.copytree(source, target, copy_function=_copy_file)
+    else:
+        _copy_file(source, target)
+
+
+def _set_writable(path, writable):
+    """
+    Adds or removes the write permissions of path and everything in it.
+    """
+    import stat
+
+    def update(entry):
+        mode = os.stat(entry).st_mode
+        if writable:
+            os.chmod(entry, mode | stat.S_IWUSR)
+        else:
+            os.chmod(entry, mode & ~(stat.S_IWUSR | stat.S_IWGRP
+                                     | stat.S_IWOTH))
+
+    if not os.path.isdir(path):
+        update(path)
+        return
+
+    # Directories are made read-only after (and writable before) their
+    # contents
+    if writable:
+        update(path)
+    for root, dirs, files in os.walk(path, topdown=writable):
+        for name in dirs + files:
+            update(os.path.join(root, name))
+    if not writable:
+        update(path)
+
+
+class ScratchDirectory:
+    """
+    A temporary working directory for running tests in.
+    """
+
+    def __init__(self, scope='worker', shared_files=(), writable_files=()):
+        """
+        Arguments
+        ---------
+        scope (str) -- 'worker' to keep one directory for all of the tests run
+            by a process, or 'test' for a fresh directory for each test.
+        shared_files (iterable of str) -- Files (or directories) that the
+            tests only read. They're copied once per run (see stage), made
+            read-only and symlinked into every scratch directory under their
+            base names, so the originals are never changed.
+        writable_files (iterable of str) -- Files (or directories) that the
+            tests may write. They're copied into every scratch directory (as
+            reflinks where the file system supports them).
+        """
+        if scope not in SCRATCH_SCOPES:
+            raise ValueError(
+                f"'{scope}' is not a valid scratch scope (expected one of "
+                f"{SCRATCH_SCOPES})."
+            )
+
+        self.scope = scope
+        self.shared_files = [os.path.abspath(path) for path in shared_files]
+        self.writable_files = [os.path.abspath(path)
+                               for path in writable_files]
+        self.path = None
+
+        # The run's read-only copy of the shared files, and whether this
+        # object made it (and so removes it)
+        self.staged = None
+        self._owns_stage = False
+
+
+    def stage(self):
+        """
+        Copies the shared files once for the run (if they aren't yet) and
+        makes the copies read-only. Called before the workers start, so that
+        they all link to the same copies.
+        """
+        if self.staged is not None or not self.shared_files:
+            return
+
+        import tempfile
+
+        self.staged = tempfile.mkdtemp(prefix='autograder-shared-',
+                                       dir=memory_directory())
+        self._owns_stage = True
+        for source in self.shared_files:
+            target = os.path.join(self.staged, os.path.basename(source))
+            _copy(source, target)
+            _set_writable(target, False)
+
+
+    def _create(self):
+        import tempfile
+
+        self.stage()
+        self.path = tempfile.mkdtemp(prefix='autograder-scratch-',
+                                     dir=memory_directory())
+        for source in self.shared_files:
+            name = os.path.basename(source)
+            os.symlink(os.path.join(self.staged, name),
+                       os.path.join(self.path, name))
+        for source in self.writable_files:
+            _copy(source, os.path.join(self.path, os.path.basename(source)))
+
+
+    @contextlib.contextmanager
+    def entered(self):
+        """
+        Runs the context with the scratch directory (created on first use) as
+        the working directory.
+        """
+        if self.path is None:
+            absolute_sys_path()
+            self._create()
+
+        old_cwd = os.getcwd()
+        os.chdir(self.path)
+        try:
+            yield self.path
+        finally:
+            os.chdir(old_cwd)
+            if self.scope == 'test':
+                self.remove()
+
+
+    def remove(self):
+        """
+        Deletes the scratch directory and everything in it.
+        """
+        if self.path is not None:
+            import shutil
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+
+
+    def close(self):
+        """
+        Deletes the scratch directory and, if this object made it, the run's
+        copy of the shared files.
+        """
+        self.remove()
+        if self.staged is not None and self._owns_stage:
+            import shutil
+            _set_writable(self.staged, True)
+            shutil.rmtree(self.staged, ignore_errors=True)
+        self.staged = None
+        self._owns_stage = False
+
+
+# The scratch directory of a multiprocessing worker (see worker_scratch)
+_worker_scratch = None
+
+
+def worker_scratch(scratch):
+    """
+    Returns this multiprocessing worker's copy of scratch, which links to
+    the shared files staged by the parent and is removed when the worker
+    exits.
+    """
+    global _worker_scratch
+    if _worker_scratch is None:
+        import multiprocessing.util
+
+        _worker_scratch = ScratchDirectory(scratch.scope, scratch.shared_files,
+                                           scratch.writable_files)
+        _worker_scratch.staged = scratch.staged
+        multiprocessing.util.Finalize(None, _worker_scratch.close,
+                                      exitpriority=5)
+
+    return _worker_scratch
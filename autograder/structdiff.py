@@ -0,0 +1,271 @@
+"""
+File: autograder/structdiff.py
+------------------------------
+
+Compares two (possibly large, nested) values by walking them together and
+reports the paths to the first few mismatches, like result[3]['key'],
+instead of printing both values in full.
+"""
+
+import collections
+import math
+import reprlib
+import sys
+
+Mismatch = collections.namedtuple(
+    'Mismatch', ('path', 'expected', 'actual', 'reason')
+)
+
+Tolerance = collections.namedtuple(
+    'Tolerance', ('rel_tol', 'abs_tol'), defaults=(1e-9, 0.0)
+)
+
+
+class _Missing:
+    """
+    The side of a mismatch that has no value (like a missing dict key), so
+    that None can be reported like any other value.
+    """
+
+    def __repr__(self):
+        return '<missing>'
+
+
+_MISSING = _Missing()
+
+_repr = reprlib.Repr()
+_repr.maxstring = 80
+_repr.maxother = 80
+_repr.maxlist = _repr.maxtuple = _repr.maxset = _repr.maxdict = 8
+
+
+def short_repr(value):
+    """
+    Returns a repr of value that is bounded in size.
+    """
+    return _repr.repr(value)
+
+
+def _numpy():
+    """
+    Returns the numpy module if it's been imported (so the comparison never
+    imports it) or None.
+    """
+    return sys.modules.get('numpy')
+
+
+def _is_array(value):
+    np = _numpy()
+    return np is not None and isinstance(value, np.ndarray)
+
+
+def _is_real(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_sequence(value):
+    return isinstance(value, (list, tuple, range, collections.deque))
+
+
+class _Walker:
+    """
+    Walks two values together and collects up to max_diffs mismatches, plus
+    one more to tell whether the walk stopped early.
+    """
+
+    def __init__(self, max_diffs, tolerance):
+        self.max_diffs = max_diffs
+        self.tolerance = tolerance
+        self.mismatches = []
+
+
+    @property
+    def full(self):
+        return len(self.mismatches) > self.max_diffs
+
+
+    def add(self, path, expected, actual, reason=None):
+        if not self.full:
+            self.mismatches.append(Mismatch(path, expected, actual, reason))
+
+
+    def walk(self, expected, actual, path):
+        if self.full:
+            return
+
+        if expected is actual:
+            return
+
+        if _is_array(expected) or _is_array(actual):
+            return self._walk_arrays(expected, actual, path)
+
+        if self.tolerance and _is_real(expected) and _is_real(actual) \
+                and (isinstance(expected, float) or isinstance(actual, float)):
+            if not math.isclose(expected, actual,
+                                rel_tol=self.tolerance.rel_tol,
+                                abs_tol=self.tolerance.abs_tol):
+                self.add(path, expected, actual)
+            return
+
+        # Equal values are skipped at C speed without walking them
+        try:
+            if expected == actual:
+                return
+        except ValueError:
+            # Ambiguous comparisons (like NumPy arrays nested in lists)
+            pass
+
+        if isinstance(expected, dict) and isinstance(actual, dict):
+            return self._walk_dicts(expected, actual, path)
+
+        if _is_sequence(expected) and _is_sequence(actual) \
+                and type(expected) is type(actual):
+            return self._walk_sequences(expected, actual, path)
+
+        if isinstance(expected, (set, frozenset)) \
+                and isinstance(actual, (set, frozenset)):
+            return self._walk_sets(expected, actual, path)
+
+        if type(expected) is not type(actual):
+            self.add(path, expected, actual,
+                     f"expected a {type(expected).__name__}, got a "
+                     f"{type(actual).__name__}")
+            return
+
+        self.add(path, expected, actual)
+
+
+    def _walk_sequences(self, expected, actual, path):
+        for index, (e, a) in enumerate(zip(expected, actual)):
+            if self.full:
+                return
+            self.walk(e, a, f'{path}[{index}]')
+
+        if len(expected) != len(actual):
+            self.add(path, expected, actual,
+                     f"expected {len(expected)} items, got {len(actual)}")
+
+
+    def _walk_dicts(self, expected, actual, path):
+        for key in expected:
+            if self.full:
+                break
+            if key not in actual:
+                self.add(f'{path}[{key!r}]', expected[key], _MISSING,
+                         'missing key')
+        for key in actual:
+            if self.full:
+                break
+            if key not in expected:
+                self.add(f'{path}[{key!r}]', _MISSING, actual[key],
+                         'unexpected key')
+
+        for key, value in expected.items():
+            if self.full:
+                return
+            if key in actual:
+                self.walk(value, actual[key], f'{path}[{key!r}]')
+
+
+    def _walk_sets(self, expected, actual, path):
+        missing = expected - actual
+        extra = actual - expected
+        if missing:
+            self.add(path, missing, _MISSING, 'missing elements')
+        if extra:
+            self.add(path, _MISSING, extra, 'unexpected elements')
+
+
+    def _walk_arrays(self, expected, actual, path):
+        """
+        Compares NumPy arrays with vectorized operations.
+        """
+        np = _numpy()
+        if not (_is_array(expected) and _is_array(actual)):
+            self.add(path, expected, actual,
+                     f"expected a {type(expected).__name__}, got a "
+                     f"{type(actual).__name__}")
+            return
+
+        if expected.shape != actual.shape:
+            self.add(path, expected, actual,
+                     f"expected shape {expected.shape}, got {actual.shape}")
+            return
+
+        numeric = (np.issubdtype(expected.dtype, np.number)
+                   and np.issubdtype(actual.dtype, np.number))
+        if numeric and self.tolerance:
+            same = np.isclose(actual, expected,
+                              rtol=self.tolerance.rel_tol,
+                              atol=self.tolerance.abs_tol, equal_nan=True)
+        else:
+            same = np.asarray(expected == actual)
+            if same.shape != expected.shape:
+                # The comparison wasn't elementwise
+                same = np.full(expected.shape, bool(same.all()))
+
+        for index in np.argwhere(~same)[:self.max_diffs + 1]:
+            index = tuple(int(i) for i in index)
+            label = ', '.join(map(str, index))
+            self.add(f'{path}[{label}]', expected[index], actual[index])
+
+
+def compare(expected, actual, max_diffs=5, tolerance=None, root='result'):
+    """
+    Walks expected and actual together and returns the mismatches between
+    them. The walk stops after max_diffs mismatches, and parts of the values
+    which are equal are compared at C speed without being walked.
+
+    Arguments
+    ---------
+    expected, actual -- The values to compare.
+    max_diffs (int) -- The maximum number of mismatches to find.
+    tolerance (Tolerance or None) -- How close floats (and NumPy arrays of
+        numbers) have to be to be considered equal.
+    root (str) -- The name of the values in the paths to mismatches.
+
+    Returns
+    -------
+    tuple -- The list of Mismatches and whether there were more than
+        max_diffs of them.
+    """
+    walker = _Walker(max_diffs, tolerance)
+    walker.walk(expected, actual, root)
+    return walker.mismatches[:max_diffs], walker.full
+
+
+def values_equal(expected, actual, tolerance=None):
+    """
+    Returns whether expected and actual are equal (up to the tolerance).
+    """
+    if tolerance is None and not (_is_array(expected) or _is_array(actual)):
+        try:
+            return bool(expected == actual)
+        except ValueError:
+            pass
+
+    mismatches, _ = compare(expected, actual, max_diffs=1,
+                            tolerance=tolerance)
+    return not mismatches
+
+
+def format_mismatches(mismatches, truncated, from_name, to_name,
+                      root='result'):
+    """
+    Formats mismatches with bounded reprs of the values.
+    """
+    lines = []
+    for path, expected, actual, reason in mismatches:
+        if path != root:
+            lines.append(f"At {path}:")
+        if reason:
+            lines.append(f"{reason}")
+        if expected is not _MISSING:
+            lines.append(f"{from_name}: {short_repr(expected)}")
+        if actual is not _MISSING:
+            lines.append(f"{to_name}: {short_repr(actual)}")
+
+    if truncated:
+        lines.append(f"(stopped after {len(mismatches)} differences)")
+
+    return '\n'.join(lines)
@@ -1,11 +1,12 @@
 import io
 import sys
-import traceback
 
 from .BaseTest import BaseTest
 from .TestResponse import TestResponse
+from autograder.fixtures import Fixture
 from autograder.printing import StatusMessage
 from autograder.io_utils import RedirectStdin
+from autograder.metrics import timed
 
 class ArgTest(BaseTest):
     def __init__(self,
@@ -15,6 +16,7 @@ class ArgTest(BaseTest):
                  kwargs={},
                  start_msg=None,
                  *pos_args,
+                 isolate_args=True,
                  **key_args):
         """
         Initializes the BaseTest object which compares the student object to
@@ -23,11 +25,14 @@ class ArgTest(BaseTest):
         Arguments
         ---------
         args (tuple) -- The positional arguments to supply to the function when 
-            tested.
+            tested. Fixtures are replaced by their values.
         kwargs (dict) -- The keyword arguments to supply to the function when
-            tested.
+            tested. Fixtures are replaced by their values.
         start_msg (str or None) -- The message to print at the beginning of the 
             test.
+        isolate_args (bool) -- Whether each call gets its own copy of the
+            arguments (so that mutations by one call aren't seen by the next)
+            and mutations by the student code are reported.
         """
         super().__init__(student_obj, solution_obj, start_msg,
                          *pos_args, **key_args)
@@ -35,12 +40,105 @@ class ArgTest(BaseTest):
         self.args = args
         self.kwargs = kwargs
 
+        self.isolate_args = isolate_args
+        self._snapshot = None
+
         # Optionally overwrite the start message with the filled out arguments
         if start_msg is None:
             self.start_msg = f"Testing {self._serialize_args()}..."
             self.start_msg = "{:68}".format(self.start_msg)
 
 
+    def _describe(self):
+        fields = super()._describe()
+        fields['args'] = self.args
+        fields['kwargs'] = self.kwargs
+        fields['isolate_args'] = self.isolate_args
+        return fields
+
+
+    def fixtures_used(self):
+        values = list(self.args) + list(self.kwargs.values())
+        return super().fixtures_used() + [
+            value for value in values if isinstance(value, Fixture)
+        ]
+
+
+    def _setup(self):
+        # The fixture values in the arguments may be rebuilt for each run
+        self._snapshot = None
+        super()._setup()
+
+
+    def _resolve_args(self):
+        """
+        Returns the (args, kwargs) with fixtures replaced by their values.
+        """
+        def resolve(value):
+            if isinstance(value, Fixture):
+                return self._fixture(value)
+            return value
+
+        args = tuple(resolve(arg) for arg in self.args)
+        kwargs = {key: resolve(value) for key, value in self.kwargs.items()}
+        return args, kwargs
+
+
+    def _call_args(self):
+        """
+        Returns the (args, kwargs) to use for one call. When the arguments are
+        isolated, they are snapshotted on the first call and each call gets
+        its own copy.
+        """
+        if not self.isolate_args:
+            return self._resolve_args()
+
+        if self._snapshot is None:
+            from autograder.isolation import ArgSnapshot
+            self._snapshot = ArgSnapshot(*self._resolve_args())
+
+        return self._snapshot.restore()
+
+
+    def _check_mutations(self, solution_args, student_args):
+        """
+        Adds a warning to the student response if the student code left the
+        copy of the arguments it was called with in a different state than
+        the solution left its copy (both are (args, kwargs) after the calls).
+        """
+        if not self.isolate_args:
+            return
+
+        different = self._snapshot.mutated(*student_args, solution_args)
+        if not different:
+            return
+
+        mutated = self._snapshot.mutated(*student_args)
+        modified = [arg for arg in different if arg in mutated]
+        unmodified = [arg for arg in different if arg not in mutated]
+
+        warnings = []
+        if modified:
+            warnings.append(
+                f"The code modified its input ({', '.join(modified)})."
+            )
+        if unmodified:
+            warnings.append(
+                f"The code didn't modify its input like the solution did "
+                f"({', '.join(unmodified)})."
+            )
+
+        response = self.student_response
+        warning = '\n'.join(warnings)
+        if response.warning:
+            warning = f"{response.warning}\n{warning}"
+
+        self.student_response = TestResponse(
+            response.output, response.stdout, response.stderr, response.name,
+            response.error, warning
+        )
+
+
     def _serialize_args(self):
         """
         Builds a string representing the function call.
@@ -61,7 +159,8 @@ class ArgTest(BaseTest):
 
     @staticmethod
     def _captured_runner(fn, args, kwargs, name,
-                         f_stdout=None, f_stderr=None, f_stdin=None):
+                         f_stdout=None, f_stderr=None, f_stdin=None,
+                         profiler=None, coverage=None):
         """
         Runs fn with args, kwargs and loads responses into a TestResponse object
         with name.
@@ -70,6 +169,9 @@ class ArgTest(BaseTest):
         -----------------
         f_stdout, f_stderr, f_stdin (buffer or None) -- The buffer to read/write
             the captured data from/to.
+        profiler (Profiler or None) -- The profiler to run fn under, if any.
+        coverage (CoverageCollector or None) -- The collector to record the
+            lines fn runs with, if any.
         """
         # Store old buffers
         __old_stdout = sys.stdout
@@ -93,10 +195,17 @@ class ArgTest(BaseTest):
 
         # Test the function
         try:
-            output = fn(*args, **kwargs)
+            with timed(f'{name}_call'):
+                if coverage:
+                    output = coverage.call(fn, args, kwargs, through=profiler)
+                elif profiler:
+                    output = profiler.call(fn, args, kwargs)
+                else:
+                    output = fn(*args, **kwargs)
 
         except Exception as e:
             # Function raised an exception
+            import traceback
             error = f"Threw {e}.\n{traceback.format_exc()}"
 
         except SystemExit:
@@ -123,12 +232,16 @@ class ArgTest(BaseTest):
         """
         self._setup()
 
+        solution_args = self._call_args()
         self.solution_response = self._captured_runner(
-            self.solution_obj, self.args, self.kwargs, 'solution'
+            self.solution_obj, *solution_args, 'solution'
         )
 
+        student_args = self._call_args()
         self.student_response = self._captured_runner(
-            self.student_obj, self.args, self.kwargs, 'student'
+            self.student_obj, *student_args, 'student',
+            profiler=self.profiler, coverage=self.coverage
         )
+        self._check_mutations(solution_args, student_args)
 
         return self._process_responses()
\ No newline at end of file
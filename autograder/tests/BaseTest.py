@@ -1,5 +1,7 @@
 import sys
 from .TestResponse import TestResponse
+from autograder.fixtures import FixtureCache
+from autograder.metrics import timed
 from autograder.printing import StatusMessage
 
 def _dummy_setup_cleanup():
@@ -11,7 +13,10 @@ class BaseTest:
                  solution_obj=None,
                  start_msg=None,
                  setup_fn=_dummy_setup_cleanup,
-                 cleanup_fn=_dummy_setup_cleanup):
+                 cleanup_fn=_dummy_setup_cleanup,
+                 tolerance=None,
+                 max_diffs=5,
+                 fixtures=()):
         """
         Initializes the BaseTest object which compares the student object to
         the solution object.
@@ -24,6 +29,12 @@ class BaseTest:
             the test executes.
         cleanup_fn (function () -> None) -- The function that will be run after
             the test executes.
+        tolerance (Tolerance or None) -- How close floats (and NumPy arrays)
+            in the return values have to be for the test to pass.
+        max_diffs (int) -- The maximum number of differences in the return
+            values to report when the test fails.
+        fixtures (iterable of Fixture) -- Fixtures to build (or take from
+            their cache) before the test runs, like a generated data file.
         """
         self.student_obj = student_obj
         self.solution_obj = solution_obj
@@ -38,12 +49,81 @@ class BaseTest:
         self._setup_fn = setup_fn
         self._cleanup_fn = cleanup_fn
 
+        self.tolerance = tolerance
+        self.max_diffs = max_diffs
+
+        self.fixtures = tuple(fixtures)
+
+        # The suite's fixture cache (set by the TestSuite) and the cache of
+        # the test-scoped fixtures while the test runs
+        self.fixture_cache = None
+        self._test_fixtures = None
+
+        # Set by the TestSuite when profiling or coverage is enabled
+        self.profiler = None
+        self.coverage = None
+
+        # In progressive mode, worker processes can't ask the grader which
+        # part of the diff to show, so they store it for the parent instead
+        self.defer_progressive = False
+        self.progressive = None
+
+        # Whether the test failed because the student code ran out of time
+        # (set by the tests that limit it)
+        self.timed_out = False
+
+
+    def _describe(self):
+        """
+        Returns the arguments that rebuild this test when passed to its
+        constructor.
+        """
+        return {
+            'student_obj': self.student_obj,
+            'solution_obj': self.solution_obj,
+            'start_msg': self.start_msg,
+            'setup_fn': self._setup_fn,
+            'cleanup_fn': self._cleanup_fn,
+            'tolerance': self.tolerance,
+            'max_diffs': self.max_diffs,
+            'fixtures': self.fixtures,
+        }
+
+
+    def __getstate__(self):
+        # Tests that can't be described are pickled for the workers, which
+        # set their own profiler, coverage and fixtures
+        state = dict(self.__dict__)
+        state.update(profiler=None, coverage=None, fixture_cache=None,
+                     _test_fixtures=None)
+        return state
+
+
+    def describe(self):
+        """
+        Returns a picklable TestDescriptor for this test. Raises a
+        DescriptorError if the test refers to an object that can't be imported
+        by name.
+        """
+        from autograder.descriptors import TestDescriptor
+        return TestDescriptor.of(self)
+
+
+    def _diff(self):
+        """
+        Returns the diff between the solution and student responses.
+        """
+        return self.solution_response.diff(
+            self.student_response, tolerance=self.tolerance,
+            max_diffs=self.max_diffs
+        )
+
 
     def _handle_pass(self):
         """
         Prints out that the test passed.
         """
-        diff = self.solution_response.diff(self.student_response)
+        diff = self._diff()
         if diff and self.student_response.warning:
             print(StatusMessage('Warning.....', 'warning'))
             print(diff)
@@ -51,52 +131,38 @@ class BaseTest:
             print(StatusMessage('Test passed!', 'success'))
 
 
-    @staticmethod
-    def __handle_progressive_diff(diff):
-        # Do Michael's progressive printing thing
-        # 1. Find the error
-        diff_lines = diff.split('\n')
-        errors = filter(
-            lambda idx_line: idx_line[1][0] == '+' or idx_line[1][0] == '-',
-            enumerate(diff_lines)
-        ) # does the line start with a + or a -?
-
-        # 2. Print the header lines and capture the first error.
-        print(next(errors)[1])
-        print(next(errors)[1])
-        fe_idx, fe_content = next(errors)
-
-        # 3. Print the first error.
-        print(fe_content)
-
-        # 4. Ask up, down, or both
-        msg = ("Type PRIOR to show all prior output, SUBSEQ for subsequent"
-               " output, or BOTH for a\nfull diff: ")
-        resp = input(msg).upper()
-
-        if resp == 'PRIOR':
-            return '\n'.join(diff_lines[:fe_idx+1])
-        elif resp == 'SUBSEQ':
-            return '\n'.join(diff_lines[fe_idx-1:])
-        else:
-            return diff
+    def _handle_progressive_fail(self):
+        """
+        Prints the first line where the printed output diverged and stores the
+        divergence, so that the grader can be asked which context to show
+        once the responses are processed (or by the parent process, if the
+        choice is deferred).
+        """
+        from autograder.divergence import Divergence
+
+        self.progressive = Divergence(
+            self.solution_response.stdout, self.student_response.stdout,
+            self.solution_response.name, self.student_response.name
+        )
+
+        print(StatusMessage('Difference in printed output:', 'info'))
+        print(self.progressive.header)
+        print(self.progressive.first_error)
 
 
     def _handle_fail(self):
         print(StatusMessage('Test failed!', 'fail'))
 
-        diff = self.solution_response.diff(self.student_response)
-
         # Check if the progressive flag is set.
         is_progressive = '-p' in sys.argv or '--progressive' in sys.argv
-        has_output_diff = self.solution_response.has_output_diff
+        solution, student = self.solution_response, self.student_response
+        has_output_diff = (not (solution.error or student.error)
+                           and solution.stdout != student.stdout)
 
         if is_progressive and has_output_diff:
-            to_print = self.__handle_progressive_diff(diff)
+            self._handle_progressive_fail()
         else:
-            to_print = diff
-
-        print(to_print)
+            print(self._diff())
 
 
     def _process_responses(self):
@@ -104,26 +170,67 @@ class BaseTest:
         Processes the two responses and returns whether the test passed or
         failed.
         """
-        output = self.solution_response == self.student_response
+        self.progressive = None
+        with timed('diff'):
+            output = self.solution_response.matches(
+                self.student_response, self.tolerance
+            )
+
+            if output:
+                self._handle_pass()
+            else:
+                self._handle_fail()
+
+        # The grader's answer isn't part of the diff's time
+        if self.progressive is not None and not self.defer_progressive:
+            from autograder.divergence import ask_progressive_choice
+            print(self.progressive.render(ask_progressive_choice()))
+
+        self._cleanup()
+        return output
 
-        if output:
-            self._handle_pass()
-        else:
-            self._handle_fail()
 
-        self._cleanup_fn()
-        return output
+    def fixtures_used(self):
+        """
+        Returns the fixtures the test needs (not including the fixtures they
+        depend on).
+        """
+        return list(self.fixtures)
+
+
+    def _fixture(self, fixture):
+        """
+        Returns the value of fixture for this run of the test.
+        """
+        if self._test_fixtures is None:
+            self._test_fixtures = FixtureCache('test', self.fixture_cache)
+        return self._test_fixtures.get(fixture)
 
 
     def _setup(self):
         """
         Sets up the test by printing the test start message and setting up by
-        calling the provided setup function.
+        building the fixtures and calling the provided setup function.
         """
+        for fixture in self.fixtures:
+            self._fixture(fixture)
+
         self._setup_fn()
         print(self.start_msg, end='')
 
 
+    def _cleanup(self):
+        """
+        Cleans up after the test by calling the provided cleanup function and
+        tearing down the test-scoped fixtures.
+        """
+        self._cleanup_fn()
+
+        if self._test_fixtures is not None:
+            self._test_fixtures.close()
+            self._test_fixtures = None
+
+
     def run(self):
         """
         Runs the base test (just compares the two objects).
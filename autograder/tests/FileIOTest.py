@@ -27,6 +27,14 @@ class FileIOTest(IOTest):
                          start_msg, *pos_args, **key_args)
 
 
+    def _describe(self):
+        # The input is read from the file again when the test is rebuilt
+        fields = super()._describe()
+        del fields['in_params']
+        fields['filename'] = self.filename
+        return fields
+
+
     def _serialize_args(self):
         """
         Builds a string representing the function call.
@@ -0,0 +1,409 @@
+import io
+import random
+import sys
+import time
+
+from .ArgTest import ArgTest
+from .TestResponse import TestResponse
+from autograder.io_utils import RedirectStdin
+from autograder.loading import time_limit
+from autograder.printing import StatusMessage
+
+
+class CallTimeout(BaseException):
+    """
+    Error that is raised inside a fuzzed call when it runs out of time. It
+    isn't an Exception so that student code can't accidentally catch it.
+    """
+    pass
+
+
+def shrink_value(value):
+    """
+    Yields values that are simpler than value, simplest first: ints and floats
+    move towards zero, and strings, bytes, lists, tuples and dicts lose
+    elements or have their elements shrunk. Other values aren't shrunk.
+    """
+    if isinstance(value, bool):
+        if value:
+            yield False
+
+    elif isinstance(value, int):
+        if value != 0:
+            yield 0
+        if value < 0:
+            yield -value
+        if abs(value) > 2:
+            yield value // 2 if value > 0 else -(-value // 2)
+        if abs(value) > 1:
+            yield value - 1 if value > 0 else value + 1
+
+    elif isinstance(value, float):
+        if value != 0.0:
+            yield 0.0
+        if value < 0:
+            yield -value
+        if value == value and abs(value) != float('inf'):
+            if value != int(value):
+                yield float(int(value))
+            if abs(value) > 1e-6:
+                yield value / 2
+
+    elif isinstance(value, (str, bytes, list, tuple)):
+        yield from _shrink_sequence(value)
+
+    elif isinstance(value, dict):
+        for key in value:
+            yield {k: v for k, v in value.items() if k != key}
+        for key, item in value.items():
+            for smaller in shrink_value(item):
+                yield {**value, key: smaller}
+
+
+def _shrink_sequence(value):
+    """
+    Yields simpler versions of a sequence: shorter ones (empty, each half,
+    without each element) and then ones with each element shrunk.
+    """
+    n = len(value)
+    if n == 0:
+        return
+
+    yield value[:0]
+    if n > 1:
+        yield value[:n // 2]
+        yield value[n // 2:]
+    for i in range(n):
+        yield value[:i] + value[i + 1:]
+
+    # The elements of strings and bytes are already as small as they get
+    if isinstance(value, (str, bytes)):
+        return
+    yield from _shrink_elements(value)
+
+
+def _shrink_elements(value):
+    """
+    Yields copies of a list or tuple with one element shrunk.
+    """
+    for i, item in enumerate(value):
+        for smaller in shrink_value(item):
+            yield value[:i] + type(value[:0])((smaller,)) + value[i + 1:]
+
+
+def shrink_args(args):
+    """
+    Yields simpler versions of the positional arguments of a call, where one
+    argument is shrunk with shrink_value (the number of arguments is kept).
+    """
+    yield from _shrink_elements(tuple(args))
+
+
+class FuzzTest(ArgTest):
+    def __init__(self,
+                 student_obj=None,
+                 solution_obj=None,
+                 generator=None,
+                 shrinker=shrink_args,
+                 num_inputs=1000,
+                 batch_size=50,
+                 time_budget=2.0,
+                 shrink_share=0.25,
+                 call_timeout=0.5,
+                 seed=0,
+                 start_msg=None,
+                 *pos_args,
+                 **key_args):
+        """
+        Compares the student and solution functions on inputs drawn from a
+        generator until they disagree, and then shrinks the input they
+        disagree on to a minimal counterexample.
+
+        Arguments
+        ---------
+        generator (function random.Random -> tuple) -- Draws the positional
+            arguments for one input using the given random number generator.
+            Any other return value is passed as the only argument.
+        shrinker (function tuple -> iterable of tuple) -- Yields simpler
+            versions of the positional arguments of a failing input, simplest
+            first.
+        num_inputs (int) -- The maximum number of inputs to draw.
+        batch_size (int) -- The number of inputs drawn (and run under one
+            capture of stdout and stderr) at a time.
+        time_budget (float) -- The number of seconds the whole test may take,
+            including shrinking. Inputs are drawn until the budget (minus the
+            share kept for shrinking) runs out.
+        shrink_share (float) -- The fraction of the time budget kept for
+            shrinking a counterexample.
+        call_timeout (float) -- The number of seconds each call of the
+            student or solution function may take (less if the time budget
+            runs out first). A student call that times out fails the input,
+            and an input the solution times out on is skipped. Only enforced
+            on platforms with SIGALRM.
+        seed (int or None) -- The seed of the random number generator, so
+            that every run draws the same inputs (None for a random seed).
+        """
+        self.generator = generator
+        self.shrinker = shrinker
+        self.num_inputs = num_inputs
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.shrink_share = shrink_share
+        self.call_timeout = call_timeout
+        self.seed = seed
+
+        # The number of inputs run and the minimal failing input (if any)
+        self.num_run = 0
+        self.counterexample = None
+
+        super().__init__(student_obj, solution_obj, (), {}, start_msg,
+                         *pos_args, **key_args)
+
+
+    def _describe(self):
+        fields = super()._describe()
+        del fields['args'], fields['kwargs']
+        fields.update(
+            generator=self.generator,
+            shrinker=self.shrinker,
+            num_inputs=self.num_inputs,
+            batch_size=self.batch_size,
+            time_budget=self.time_budget,
+            shrink_share=self.shrink_share,
+            call_timeout=self.call_timeout,
+            seed=self.seed,
+        )
+        return fields
+
+
+    def _serialize_args(self):
+        """
+        Builds a string representing the fuzzed calls.
+        """
+        return (f"{self.student_obj.__name__} on {self.num_inputs} random "
+                f"inputs")
+
+
+    def _serialize_call(self, args):
+        """
+        Builds a string representing the call with args.
+        """
+        return (f"{self.student_obj.__name__}"
+                f"({', '.join(repr(arg) for arg in args)})")
+
+
+    def _generate(self, rng):
+        """
+        Draws the arguments for one input.
+        """
+        args = self.generator(rng)
+        if not isinstance(args, tuple):
+            args = (args,)
+        return args
+
+
+    def _call(self, fn, args, name, f_stdout, f_stderr, student, timeout):
+        """
+        Calls fn with a copy of args while stdout and stderr are captured by
+        f_stdout and f_stderr (which are cleared first) and the call is
+        limited to timeout seconds. Returns its TestResponse and whether it
+        timed out.
+        """
+        if self.isolate_args:
+            from autograder.isolation import ArgSnapshot
+            args, _ = ArgSnapshot(args, {}).restore()
+
+        for f in (f_stdout, f_stderr):
+            f.seek(0)
+            f.truncate()
+
+        output = None
+        error = None
+        warning = None
+        timed_out = False
+        try:
+            with time_limit(timeout, CallTimeout):
+                if student and self.coverage:
+                    output = self.coverage.call(fn, args, {},
+                                                through=self.profiler)
+                elif student and self.profiler:
+                    output = self.profiler.call(fn, args, {})
+                else:
+                    output = fn(*args)
+
+        except CallTimeout:
+            timed_out = True
+            error = f"The code took more than {timeout:.3g} seconds."
+
+        except Exception as e:
+            import traceback
+            error = f"Threw {e}.\n{traceback.format_exc()}"
+
+        except SystemExit:
+            warning = 'The code tried to exit the Python process.'
+
+        response = TestResponse(output, f_stdout.getvalue(),
+                                f_stderr.getvalue(), name, error, warning)
+        return response, timed_out
+
+
+    def _run_batch(self, inputs, deadline, end):
+        """
+        Runs the solution and the student on each input in turn, under one
+        capture of stdio, until they disagree or the deadline passes. Each
+        call is limited to call_timeout seconds, or to the time left before
+        end (when the whole test has to finish). A student call that hits
+        call_timeout counts as a disagreement, while a call cut short by end
+        stops the batch without one. Returns the number of inputs run and the
+        (args, solution response, student response, whether the student timed
+        out) of the first mismatch, or None.
+        """
+        __old_stdout = sys.stdout
+        __old_stderr = sys.stderr
+        __old_stdin = sys.stdin
+
+        f_stdout = io.StringIO()
+        f_stderr = io.StringIO()
+        sys.stdout = f_stdout
+        sys.stderr = f_stderr
+        sys.stdin = RedirectStdin()
+
+        num_run = 0
+        try:
+            for args in inputs:
+                timeout = self._call_limit(end)
+                if timeout is None:
+                    break
+                solution, timed_out = self._call(self.solution_obj, args,
+                                                 'solution', f_stdout,
+                                                 f_stderr, False, timeout)
+                if timed_out and timeout != self.call_timeout:
+                    break
+
+                if not timed_out:
+                    timeout = self._call_limit(end)
+                    if timeout is None:
+                        break
+                    student, timed_out = self._call(self.student_obj, args,
+                                                    'student', f_stdout,
+                                                    f_stderr, True, timeout)
+                    if timed_out and timeout != self.call_timeout:
+                        break
+
+                    failed = (timed_out
+                              or not solution.matches(student,
+                                                      self.tolerance))
+                    if failed:
+                        return num_run + 1, (args, solution, student,
+                                             timed_out)
+
+                # Inputs the solution timed out on are skipped
+                num_run += 1
+                if time.perf_counter() > deadline:
+                    break
+
+        finally:
+            sys.stdout = __old_stdout
+            sys.stderr = __old_stderr
+            sys.stdin = __old_stdin
+
+        return num_run, None
+
+
+    def _call_limit(self, end):
+        """
+        Returns the number of seconds the next call may take, or None if the
+        time budget has run out.
+        """
+        left = end - time.perf_counter()
+        if left <= 0:
+            return None
+        if self.call_timeout:
+            return min(self.call_timeout, left)
+        return left
+
+
+    def _search(self, deadline, end):
+        """
+        Draws batches of inputs until the student and solution disagree on
+        one, the inputs run out or the deadline passes. Returns the first
+        mismatch (see _run_batch) or None.
+        """
+        rng = random.Random(self.seed)
+
+        while self.num_run < self.num_inputs:
+            size = min(self.batch_size, self.num_inputs - self.num_run)
+            inputs = [self._generate(rng) for _ in range(size)]
+
+            num_run, mismatch = self._run_batch(inputs, deadline, end)
+            self.num_run += num_run
+            if mismatch or time.perf_counter() > deadline:
+                return mismatch
+
+        return None
+
+
+    def _shrink(self, mismatch, deadline):
+        """
+        Greedily replaces the failing input with the first simpler input that
+        still fails (a student call that times out counts as failing), until
+        no simpler input fails or the deadline passes. Candidates are run in
+        batches like the search. Returns the minimal mismatch found.
+        """
+        while time.perf_counter() < deadline:
+            candidates = iter(self.shrinker(mismatch[0]))
+            smaller = None
+
+            while smaller is None and time.perf_counter() < deadline:
+                batch = [candidate for _, candidate
+                         in zip(range(self.batch_size), candidates)]
+                if not batch:
+                    break
+                _, smaller = self._run_batch(batch, deadline, deadline)
+
+            if smaller is None:
+                break
+            mismatch = smaller
+
+        return mismatch
+
+
+    def _handle_progressive_fail(self):
+        print(StatusMessage('Counterexample:', 'info'))
+        print(self.counterexample)
+        super()._handle_progressive_fail()
+
+
+    def _diff(self):
+        diff = super()._diff()
+        if self.counterexample is None:
+            return diff
+
+        return (f"{StatusMessage('Counterexample:', 'info')}\n"
+                f"{self.counterexample}\n{diff}")
+
+
+    def run(self):
+        """
+        Runs the fuzz test (compares both functions on random inputs and
+        shrinks the first input they disagree on).
+        """
+        self._setup()
+        self.num_run = 0
+        self.counterexample = None
+        self.timed_out = False
+
+        start = time.perf_counter()
+        end = start + self.time_budget
+        mismatch = self._search(end - self.time_budget * self.shrink_share,
+                                end)
+
+        if mismatch is None:
+            print(StatusMessage('Test passed!', 'success'))
+            self._cleanup()
+            return True
+
+        (args, self.solution_response, self.student_response,
+         self.timed_out) = self._shrink(mismatch, end)
+        self.counterexample = self._serialize_call(args)
+        return self._process_responses()
@@ -16,6 +16,12 @@ class IOTest(ArgTest):
         self.stdin_buffer = RedirectStdin(in_params)
 
 
+    def _describe(self):
+        fields = super()._describe()
+        fields['in_params'] = self.stdin_buffer.to_output
+        return fields
+
+
     def run(self):
         """
         Runs the IO test (captures stdout, stderr, provides the given input
@@ -24,17 +30,21 @@ class IOTest(ArgTest):
         self._setup()
 
         # Run solution code and reset the buffer
+        solution_args = self._call_args()
         self.solution_response = self._captured_runner(
-            self.solution_obj, self.args, self.kwargs, 'solution',
+            self.solution_obj, *solution_args, 'solution',
             f_stdin=self.stdin_buffer
         )
         self.stdin_buffer.reset_buffer()
 
         # Run student code and reset the buffer
+        student_args = self._call_args()
         self.student_response = self._captured_runner(
-            self.student_obj, self.args, self.kwargs, 'student',
-            f_stdin=self.stdin_buffer
+            self.student_obj, *student_args, 'student',
+            f_stdin=self.stdin_buffer, profiler=self.profiler,
+            coverage=self.coverage
         )
         self.stdin_buffer.reset_buffer()
+        self._check_mutations(solution_args, student_args)
 
         return self._process_responses()
\ No newline at end of file
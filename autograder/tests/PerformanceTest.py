@@ -0,0 +1,478 @@
+import gc
+import io
+import math
+import sys
+import time
+
+from .ArgTest import ArgTest
+from autograder.isolation import ArgSnapshot
+from autograder.printing import StatusMessage
+
+# Candidate growth curves, ordered from cheapest to most expensive.
+GROWTH_CLASSES = (
+    ('O(1)', lambda n: 1.0),
+    ('O(log n)', lambda n: math.log2(max(n, 2))),
+    ('O(n)', lambda n: float(n)),
+    ('O(n log n)', lambda n: n * math.log2(max(n, 2))),
+    ('O(n^2)', lambda n: float(n) ** 2),
+    ('O(n^3)', lambda n: float(n) ** 3),
+)
+
+
+def fit_growth(sizes, times, parsimony=0.1):
+    """
+    Fits each growth curve g to the measurements as t = a + c * g(n) and
+    returns (rank, name, c) for the best fitting curve.
+
+    Arguments
+    ---------
+    sizes (list of int) -- The input sizes that were measured.
+    times (list of float) -- The time per call at each input size.
+    parsimony (float) -- A cheaper curve is preferred over the best fit as long
+        as its squared error is within this fraction of the best one.
+    """
+    fits = []
+    mean_t = sum(times) / len(times)
+    for rank, (name, curve) in enumerate(GROWTH_CLASSES):
+        g = [curve(n) for n in sizes]
+        mean_g = sum(g) / len(g)
+        var_g = sum((x - mean_g) ** 2 for x in g)
+
+        if var_g == 0:
+            # Constant curve: the best fit is the mean.
+            a, c = mean_t, 0.0
+        else:
+            c = sum((x - mean_g) * (t - mean_t)
+                    for x, t in zip(g, times)) / var_g
+            if c < 0:
+                # Time decreasing with n isn't a meaningful fit.
+                continue
+            a = mean_t - c * mean_g
+
+        sse = sum((t - (a + c * x)) ** 2 for x, t in zip(g, times))
+        fits.append((sse, rank, name, c))
+
+    best_sse = min(fit[0] for fit in fits)
+    for sse, rank, name, c in fits:
+        if sse <= best_sse * (1 + parsimony) + 1e-18:
+            return rank, name, c
+
+
+def growth_slope(sizes, times):
+    """
+    Returns the slope of log(time) against log(n), the exponent k of the best
+    fitting t = c * n^k. Neighbouring growth classes (like O(n) and
+    O(n log n)) have nearly the same slope over a few doublings of n, so
+    slopes tell apart the classes that really differ even with noisy timings.
+    """
+    xs = [math.log(n) for n in sizes]
+    ys = [math.log(max(t, 1e-12)) for t in times]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return 0.0
+
+    return sum((x - mean_x) * (y - mean_y)
+               for x, y in zip(xs, ys)) / var_x
+
+
+class GrowthProfile:
+    """
+    The measurements of a single function across the input sizes.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.sizes = []
+        self.times = []
+        self.peak_memory = []
+        self.rank = None
+        self.growth = None
+        self.constant = None
+        self.slope = None
+
+        # The input size whose call took longer than the time limit (if any)
+        self.timed_out = None
+
+
+    def fit(self, parsimony=0.1):
+        """
+        Fits a growth curve and a log-log slope to the measured times.
+        """
+        self.rank, self.growth, self.constant = fit_growth(
+            self.sizes, self.times, parsimony
+        )
+        self.slope = growth_slope(self.sizes, self.times)
+
+
+    def time_at(self, n):
+        return self.times[self.sizes.index(n)]
+
+
+    def memory_at(self, n):
+        return self.peak_memory[self.sizes.index(n)]
+
+
+class PerformanceTest(ArgTest):
+    def __init__(self,
+                 student_obj=None,
+                 solution_obj=None,
+                 generator=None,
+                 sizes=(64, 128, 256, 512, 1024, 2048),
+                 repeats=5,
+                 warmup=1,
+                 min_time=0.005,
+                 max_time=2.0,
+                 disable_gc=True,
+                 max_class_gap=0,
+                 slope_margin=0.5,
+                 max_ratio=10.0,
+                 measure_memory=False,
+                 max_memory_ratio=None,
+                 start_msg=None,
+                 *pos_args,
+                 **key_args):
+        """
+        Times the student and solution functions across a series of input
+        sizes and compares how they scale.
+
+        Arguments
+        ---------
+        generator (function int -> tuple) -- Builds the positional arguments
+            for an input of the given size. Any other return value is passed
+            as the only argument.
+        sizes (tuple of int) -- The input sizes to time, in increasing order.
+        repeats (int) -- The number of timings taken at each size. The fastest
+            is kept.
+        warmup (int) -- The number of untimed calls before timing each size.
+        min_time (float) -- The minimum duration of a single timing, in
+            seconds. Fast functions are called in a loop to reach it.
+        max_time (float) -- If a single student call takes longer than this,
+            larger sizes are skipped. Timing a size also stops taking more
+            timings (and warmup calls) once it has spent this long.
+        disable_gc (bool) -- Whether to disable the garbage collector while
+            timing.
+        max_class_gap (int) -- The number of growth classes the student may
+            be above the solution.
+        slope_margin (float) -- How much steeper the student's log-log slope
+            has to be than the solution's before a worse growth class counts.
+            Timings are noisy, so neighbouring classes like O(n) and
+            O(n log n) can't be told apart reliably.
+        max_ratio (float) -- The largest allowed ratio of student time to
+            solution time at the largest measured size.
+        measure_memory (bool) -- Whether to record peak memory with
+            tracemalloc.
+        max_memory_ratio (float or None) -- The largest allowed ratio of
+            student peak memory to solution peak memory.
+        """
+        self.generator = generator
+        self.sizes = tuple(sorted(sizes))
+        self.repeats = repeats
+        self.warmup = warmup
+        self.min_time = min_time
+        self.max_time = max_time
+        self.disable_gc = disable_gc
+        self.max_class_gap = max_class_gap
+        self.slope_margin = slope_margin
+        self.max_ratio = max_ratio
+        self.measure_memory = measure_memory or max_memory_ratio is not None
+        self.max_memory_ratio = max_memory_ratio
+
+        super().__init__(student_obj, solution_obj, (), {}, start_msg,
+                         *pos_args, **key_args)
+
+
+    def _describe(self):
+        fields = super()._describe()
+        del fields['args'], fields['kwargs']
+        fields.update(
+            generator=self.generator,
+            sizes=self.sizes,
+            repeats=self.repeats,
+            warmup=self.warmup,
+            min_time=self.min_time,
+            max_time=self.max_time,
+            disable_gc=self.disable_gc,
+            max_class_gap=self.max_class_gap,
+            slope_margin=self.slope_margin,
+            max_ratio=self.max_ratio,
+            measure_memory=self.measure_memory,
+            max_memory_ratio=self.max_memory_ratio,
+        )
+        return fields
+
+
+    def _serialize_args(self):
+        """
+        Builds a string representing the timed calls.
+        """
+        return (f"{self.student_obj.__name__}(n) for n = "
+                f"{self.sizes[0]}..{self.sizes[-1]}")
+
+
+    def _generate(self, n):
+        """
+        Builds the arguments for an input of size n.
+        """
+        args = self.generator(n)
+        if not isinstance(args, tuple):
+            args = (args,)
+        return args
+
+
+    def _time(self, fn, snapshot, deadline=None):
+        """
+        Returns the fastest time per call of fn over self.repeats timings,
+        where each call gets fresh arguments from snapshot (an ArgSnapshot).
+        No more timings are started once deadline (a time.perf_counter()
+        value, if given) has passed.
+        """
+        def past_deadline():
+            return deadline is not None and time.perf_counter() > deadline
+
+        if self.disable_gc:
+            # Start each size from a clean heap
+            gc.collect()
+
+        # Figure out how many calls are needed to reach min_time
+        number = 1
+        while True:
+            elapsed = self._time_loop(fn, snapshot, number)
+            if elapsed >= self.min_time or number >= 1 << 20 \
+                    or past_deadline():
+                break
+            number *= 2
+
+        best = elapsed
+        for _ in range(self.repeats - 1):
+            if past_deadline():
+                break
+            best = min(best, self._time_loop(fn, snapshot, number))
+
+        return best / number
+
+
+    def _time_loop(self, fn, snapshot, number):
+        """
+        Times number calls of fn with the garbage collector optionally
+        disabled. Mutable arguments are copied from snapshot before each call
+        (outside of the timing), so that an in-place algorithm never runs on
+        the input it already changed.
+        """
+        gc_was_enabled = gc.isenabled()
+        if self.disable_gc:
+            gc.disable()
+
+        try:
+            if not snapshot.positions:
+                # The arguments can't change, so they're shared by all calls
+                args = snapshot.args
+                start = time.perf_counter()
+                for _ in range(number):
+                    fn(*args)
+                return time.perf_counter() - start
+
+            elapsed = 0.0
+            for _ in range(number):
+                args, _ = snapshot.restore()
+                start = time.perf_counter()
+                fn(*args)
+                elapsed += time.perf_counter() - start
+            return elapsed
+
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+
+    @staticmethod
+    def _peak_memory(fn, snapshot):
+        """
+        Returns the peak memory allocated by a single call of fn on fresh
+        arguments from snapshot.
+        """
+        import tracemalloc
+
+        args, _ = snapshot.restore()
+
+        was_tracing = tracemalloc.is_tracing()
+        if was_tracing and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            # Starting to trace resets the peak (before Python 3.9, that's
+            # the only way to reset it)
+            tracemalloc.stop()
+            tracemalloc.start()
+
+        baseline = tracemalloc.get_traced_memory()[0]
+
+        try:
+            fn(*args)
+            return tracemalloc.get_traced_memory()[1] - baseline
+
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+
+    def _measure(self, fn, name, limit=None):
+        """
+        Measures fn at each input size and returns a GrowthProfile. If limit
+        is given, stops once a single call takes longer than it, and spends
+        at most about limit seconds timing each size. Returns the profile and
+        the TestResponse of the first failing call (or None).
+        """
+        profile = GrowthProfile(name)
+
+        __old_stdout = sys.stdout
+        __old_stderr = sys.stderr
+
+        for n in self.sizes:
+            snapshot = ArgSnapshot(self._generate(n), {})
+            start = time.perf_counter()
+            deadline = None if limit is None else start + limit
+
+            # Warm up and make sure that the call succeeds
+            for _ in range(max(self.warmup, 1)):
+                student = name == 'student'
+                args, _ = snapshot.restore()
+                response = self._captured_runner(
+                    fn, args, {}, name,
+                    profiler=self.profiler if student else None,
+                    coverage=self.coverage if student else None
+                )
+                if response.error:
+                    return profile, response
+                if deadline is not None and time.perf_counter() > deadline:
+                    break
+
+            if deadline is not None and time.perf_counter() > deadline:
+                # The warmup alone used up the time for this size
+                profile.timed_out = n
+                break
+
+            # Silence any printing while timing
+            sys.stdout = io.StringIO()
+            sys.stderr = io.StringIO()
+            try:
+                elapsed = self._time(fn, snapshot)
+                if self.measure_memory:
+                    profile.peak_memory.append(
+                        self._peak_memory(fn, snapshot)
+                    )
+            finally:
+                sys.stdout = __old_stdout
+                sys.stderr = __old_stderr
+
+            profile.sizes.append(n)
+            profile.times.append(elapsed)
+
+            if limit is not None and elapsed > limit:
+                profile.timed_out = n
+                break
+
+        return profile, None
+
+
+    def _compare(self):
+        """
+        Compares the two growth profiles and returns a list of problems.
+        """
+        solution = self.solution_profile
+        student = self.student_profile
+        problems = []
+
+        if len(student.sizes) < min(3, len(self.sizes)):
+            return [f"The student code took more than {self.max_time}s on an "
+                    f"input of size {student.timed_out}."]
+
+        solution.fit()
+        student.fit()
+
+        steeper = student.slope - solution.slope > self.slope_margin
+        if student.rank - solution.rank > self.max_class_gap and steeper:
+            problems.append(
+                f"The student code scales like {student.growth}, but the "
+                f"solution scales like {solution.growth}."
+            )
+
+        largest = student.sizes[-1]
+        ratio = student.time_at(largest) / solution.time_at(largest)
+        if ratio > self.max_ratio:
+            problems.append(
+                f"The student code was {ratio:.1f}x slower than the solution "
+                f"on an input of size {largest} (limit: {self.max_ratio}x)."
+            )
+
+        if self.max_memory_ratio is not None:
+            mem_ratio = (student.memory_at(largest)
+                         / max(solution.memory_at(largest), 1))
+            if mem_ratio > self.max_memory_ratio:
+                problems.append(
+                    f"The student code used {mem_ratio:.1f}x the peak memory "
+                    f"of the solution on an input of size {largest} (limit: "
+                    f"{self.max_memory_ratio}x)."
+                )
+
+        return problems
+
+
+    def _format_table(self):
+        """
+        Builds a table of the measurements for both functions.
+        """
+        show_memory = self.measure_memory
+        header = f"{'n':>10} {'solution':>14} {'student':>14}"
+        if show_memory:
+            header += f" {'solution mem':>14} {'student mem':>14}"
+
+        lines = [header]
+        for n in self.student_profile.sizes:
+            line = (f"{n:>10} {self.solution_profile.time_at(n):>13.3g}s "
+                    f"{self.student_profile.time_at(n):>13.3g}s")
+            if show_memory:
+                line += (f" {self.solution_profile.memory_at(n):>13}B "
+                         f"{self.student_profile.memory_at(n):>13}B")
+            lines.append(line)
+
+        return '\n'.join(lines)
+
+
+    def run(self):
+        """
+        Runs the performance test (times both functions across the input
+        sizes and compares their growth).
+        """
+        self._setup()
+        self.timed_out = False
+
+        self.solution_profile, solution_error = self._measure(
+            self.solution_obj, 'solution'
+        )
+        self.student_profile, student_error = self._measure(
+            self.student_obj, 'student', limit=self.max_time
+        )
+
+        if solution_error or student_error:
+            print(StatusMessage('Test failed!', 'fail'))
+            error = solution_error or student_error
+            header = f"{error.name.title()} threw an unexpected error:"
+            print(f"{StatusMessage(header, 'info')}\n{error.error}")
+            self._cleanup()
+            return False
+
+        problems = self._compare()
+        passed = not problems
+        self.timed_out = self.student_profile.timed_out is not None
+
+        if passed:
+            print(StatusMessage('Test passed!', 'success'))
+        else:
+            print(StatusMessage('Test failed!', 'fail'))
+            print(StatusMessage('Difference in performance:', 'info'))
+            print('\n'.join(problems))
+            print(self._format_table())
+
+        self._cleanup()
+        return passed
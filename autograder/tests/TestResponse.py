@@ -1,7 +1,7 @@
 import collections
-from difflib import unified_diff
 
 from autograder.printing import StatusMessage
+from autograder.structdiff import compare, format_mismatches, values_equal
 
 BaseTestResponse = collections.namedtuple(
     'TestResponse',
@@ -10,10 +10,17 @@ BaseTestResponse = collections.namedtuple(
 )
 
 class TestResponse(BaseTestResponse):
-    def __init__(self, *args, **kwargs):
+    def __new__(cls, *args, **kwargs):
+        # The fields of a namedtuple can't be set after it's built, so
+        # anything printed to stderr becomes the warning here
+        self = super().__new__(cls, *args, **kwargs)
         if self.stderr and not self.warning:
-            self.warning = self.stderr
+            self = self._replace(warning=self.stderr)
+
+        return self
+
 
+    def __init__(self, *args, **kwargs):
         self.has_output_diff = False
 
 
@@ -23,16 +30,25 @@ class TestResponse(BaseTestResponse):
         same, the printed output was the same, and there was no difference in
         error throwing.
         """
+        return self.matches(other)
+
+
+    def matches(self, other, tolerance=None):
+        """
+        Compares two TestResponse objects like ==, where return values only
+        have to be equal up to the tolerance (a structdiff.Tolerance or None).
+        """
         if self.error and other.error:
             # Don't care about anything else
             return True
 
-        return (self.output == other.output \
-                and self.stdout == other.stdout \
-                and bool(self.error) == bool(other.error))
+        return (self.stdout == other.stdout \
+                and bool(self.error) == bool(other.error) \
+                and values_equal(self.output, other.output, tolerance))
 
 
-    def diff(self, other, self_name=None, other_name=None):
+    def diff(self, other, self_name=None, other_name=None, tolerance=None,
+             max_diffs=5):
         """
         Returns a diff between self and another test response object. This is
         intended for comparing the student output to the solution output.
@@ -43,6 +59,10 @@ class TestResponse(BaseTestResponse):
         self_name (str or None) -- The title of the current test response 
             object.
         other_name (str or None) -- The title of the other test response object.
+        tolerance (Tolerance or None) -- How close floats in the return values
+            have to be to be considered equal.
+        max_diffs (int) -- The maximum number of differences in the return
+            values to report.
 
         Returns
         -------
@@ -76,6 +96,8 @@ class TestResponse(BaseTestResponse):
         printing_error = self.stdout != other.stdout
 
         if printing_error:
+            from difflib import unified_diff
+
             self_output = self.stdout.splitlines(keepends=True)
             other_output = other.stdout.splitlines(keepends=True)
             diff = ''.join(unified_diff(
@@ -92,13 +114,15 @@ class TestResponse(BaseTestResponse):
                     f"{diff}")
 
         # Case 3: Difference in return value.
-        return_error = self.output != other.output
+        mismatches, truncated = compare(
+            self.output, other.output, max_diffs, tolerance
+        )
 
-        if return_error:
+        if mismatches:
             return (
                 f"{StatusMessage('Difference in value:', 'info')}\n"
-                f"{self_name}: {repr(self.output)}\n"
-                f"{other_name}: {repr(other.output)}"
+                + format_mismatches(mismatches, truncated, self_name,
+                                    other_name)
             )
 
         # Case 4: Warning!
@@ -108,7 +132,7 @@ class TestResponse(BaseTestResponse):
             both_warned = self.warning and other.warning
             if not both_warned:
                 # Problem: one raised a warning.
-                if self.error:
+                if self.warning:
                     header = f"{self_name} caused a warning:"
                     warning_line = f"{self.warning}"
                 else:
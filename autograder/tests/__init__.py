@@ -2,4 +2,6 @@
 from .BaseTest import BaseTest
 from .IOTest import IOTest
 from .FileIOTest import FileIOTest
-from .ArgTest import ArgTest
\ No newline at end of file
+from .ArgTest import ArgTest
+from .PerformanceTest import PerformanceTest
+from .FuzzTest import FuzzTest
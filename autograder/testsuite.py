@@ -1,59 +1,288 @@
 import contextlib
 import io
-import multiprocessing as mp
+import os
 import sys
+import time
 from autograder.tests import BaseTest
-from .printing import StatusMessage
+from .descriptors import DescriptorError, TestDescriptor
+from .divergence import ask_progressive_choice
+from .fixtures import FixtureCache, dump_shared, worker_cache
+from .metrics import MetricsRegistry, active, recording
+from .scratch import ScratchDirectory, worker_scratch
+from .printing import StatusMessage, HeaderMessage
+
+# The tests of the suite being run, inherited by forked workers
+_forked_tests = []
+
+# Only tests for which this returns True are run (see select_tests)
+_test_filter = None
+
+# Where suites record and replay the results of tests (see journal_tests)
+_test_journal = None
+
+# What suites compact the responses of their tests with (see
+# compact_responses)
+_response_store = None
+
+
+@contextlib.contextmanager
+def select_tests(predicate):
+    """
+    Within the context, suites only run the tests for which predicate(test)
+    returns True. Used by watch mode to rerun only the affected tests.
+    """
+    global _test_filter
+    old_filter = _test_filter
+    _test_filter = predicate
+    try:
+        yield
+    finally:
+        _test_filter = old_filter
+
+
+@contextlib.contextmanager
+def journal_tests(journal):
+    """
+    Within the context, suites replay the output of the tests that journal (a
+    SubmissionJournal) already has results for instead of running them, and
+    record the results of the tests they do run. Used by batch grading to
+    resume interrupted runs.
+    """
+    global _test_journal
+    old_journal = _test_journal
+    _test_journal = journal
+    try:
+        yield
+    finally:
+        _test_journal = old_journal
+
+
+@contextlib.contextmanager
+def compact_responses(store):
+    """
+    Within the context, suites replace the responses of the tests they run
+    with compact ones from store (a ResponseStore). Used by batch grading so
+    that the responses kept while a submission is graded stay small.
+    """
+    global _response_store
+    old_store = _response_store
+    _response_store = store
+    try:
+        yield
+    finally:
+        _response_store = old_store
+
+
+def _entered(scratch):
+    """
+    Returns a context that runs in scratch (a ScratchDirectory) if it's given.
+    """
+    return scratch.entered() if scratch else contextlib.nullcontext()
+
 
 class TestRunner:
-    def __init__(self, res_queue, print_val, print_condn):
+    """
+    A pickle-able object to use for multiprocessing test running. Each call
+    runs a chunk of tests and returns all of their results in one message.
+    """
+
+    def __init__(self, profiler=None, coverage=None, shared_fixtures=None,
+                 scratch=None, metrics=False):
         """
-        A pickle-able object to use for multiprocessing test running.
+        Arguments
+        ---------
+        profiler (Profiler or None) -- An empty profiler to run the tests
+            under, if profiling is enabled.
+        coverage (CoverageCollector or None) -- An empty collector to record
+            the lines of student code each test runs, if coverage is enabled.
+        shared_fixtures (dict or None) -- Maps the keys of the fixtures
+            built by the parent process to the files they were shared in.
+        scratch (ScratchDirectory or None) -- The kind of scratch directory
+            to run the tests in, if any.
+        metrics (bool) -- Whether to record metrics of the tests and send
+            them back with the results.
+        """
+        self.profiler = profiler
+        self.coverage = coverage
+        self.shared_fixtures = shared_fixtures or {}
+        self.scratch = scratch
+        self.metrics = metrics
 
+
+    def __call__(self, chunk):
+        """
+        Runs the (index, test) pairs in chunk. Each test may be a
+        TestDescriptor, in which case it is rebuilt in this process first,
+        None, in which case it is looked up in the tests inherited from the
+        parent process, or the test itself.
+
+        Returns
+        -------
+        tuple -- A list of (index, passed, printed output, progressive
+            divergence, profile, coverage) for each test, the number of
+            seconds it took to run the chunk and the metrics it recorded (see
+            MetricsRegistry.collect) or None.
+        """
+        start = time.perf_counter()
+        results = []
+        registry = MetricsRegistry() if self.metrics else None
+
+        # Suite fixtures and scratch directories are made once per worker
+        fixture_cache = worker_cache(self.shared_fixtures)
+        scratch = worker_scratch(self.scratch) if self.scratch else None
+
+        for index, test in chunk:
+            if isinstance(test, TestDescriptor):
+                test = test.resolve()
+            elif test is None:
+                test = _forked_tests[index]
+            # Otherwise the test was pickled as it is
+            test.profiler = self.profiler
+            test.coverage = self.coverage
+            test.fixture_cache = fixture_cache
+            test.defer_progressive = True
+
+            # Run test
+            f = io.StringIO()
+            test_start = time.perf_counter()
+            with contextlib.redirect_stdout(f), _entered(scratch), \
+                    recording(registry):
+                passed = test.run()
+            if registry:
+                registry.observe_test(test, passed,
+                                      time.perf_counter() - test_start)
+
+            profile = self.profiler.collect() if self.profiler else None
+            coverage = self.coverage.collect() if self.coverage else None
+            results.append((index, passed, f.getvalue(), test.progressive,
+                            profile, coverage))
+
+        return (results, time.perf_counter() - start,
+                registry.collect() if registry else None)
+
+
+class ChunkSizer:
+    """
+    Picks how many tests to send to a worker at once. Small tests are
+    batched so that the cost of sending them to the worker is amortized,
+    based on the per-test cost measured from the chunks that have finished.
+    """
+
+    def __init__(self, num_tests, num_workers, chunk_time=0.02):
+        """
         Arguments
         ---------
-        res_queue (mp.Queue) -- The queue in which to add the result of the 
-            test.
-        print_val (mp.Value) -- The value of the thread that has the okay to 
-            print.
-        print_condn (mp.Condition) -- The condition on which the process should
-            wait to print
-        """
-        self.queue = res_queue
-        self.print_val = print_val
-        self.print_condn = print_condn
-
-
-    def __call__(self, index, test):
-        # Run test
-        f = io.StringIO()
-        with contextlib.redirect_stdout(f):
-            passed = test.run()
-        out = f.getvalue()
-
-        # Queue result and test number
-        self.queue.put((index, passed))
-
-        # Print result
-        with self.print_condn:
-            while not self.print_val.value == index:
-                self.print_condn.wait()
-        
-            print(out, end='')
-            self.print_val.value += 1
-            self.print_condn.notify_all()
+        num_tests (int) -- The number of tests to be run.
+        num_workers (int) -- The number of processes in the pool.
+        chunk_time (float) -- The target number of seconds per chunk.
+        """
+        self.remaining = num_tests
+        self.num_workers = num_workers
+        self.chunk_time = chunk_time
+
+        self.tests_measured = 0
+        self.time_measured = 0.0
+
+
+    def record(self, num_tests, elapsed):
+        """
+        Records that a chunk of num_tests tests took elapsed seconds.
+        """
+        self.tests_measured += num_tests
+        self.time_measured += elapsed
+
+
+    def next_size(self):
+        """
+        Returns the size of the next chunk.
+        """
+        if not self.tests_measured:
+            # Nothing is known about the tests yet
+            size = 1
+        else:
+            cost = self.time_measured / self.tests_measured
+            size = int(self.chunk_time / cost) if cost else self.remaining
+
+            # Leave enough chunks to keep every worker busy until the end
+            fair_share = self.remaining // (2 * self.num_workers)
+            size = max(1, min(size, fair_share))
+
+        size = min(size, self.remaining)
+        self.remaining -= size
+        return size
 
 
 class TestSuite:
-    def __init__(self, tests=[], multiprocess=False, ml=None):
+    def __init__(self, tests=[], multiprocess=False, ml=None, profile=None,
+                 profile_output=None, chunk_time=0.02, start_method=None,
+                 coverage=None, scratch=None, shared_files=(),
+                 writable_files=(), compact=False, metrics=None):
         """
-        A collection of tests to be run together. Supports multiprocessing and
-        ML integration.
+        A collection of tests to be run together. Supports multiprocessing,
+        ML integration, profiling, coverage, scratch directories and metrics.
 
         ML Integration:
             ml should be a function which accepts a list of 1s and 0s. That list
             will signify the tests that the program passes (1) and fails (0) in
             the correct order.
+
+        Profiling:
+            profile can be a Profiler, a profiling mode ('cprofile' or
+            'sample') or True for the default mode. Profiling is also enabled
+            by the --profile command line flag. The student code in each test
+            is profiled and a report of the hot spots is printed after the
+            suite. If profile_output is given, the aggregated profile is also
+            written to profile_output.pstats and profile_output.collapsed.
+
+        Coverage:
+            If coverage is True (or the --coverage command line flag is
+            given), the lines of the student module run by each test are
+            recorded in test_coverage (one bitset per file for each test, in
+            the same order as pass_list) and a report of the lines no test
+            ran is printed after the suite.
+
+        Scratch directories:
+            If scratch is 'worker' or 'test', the tests run in a temporary
+            working directory (in /dev/shm where possible) that is kept for
+            every test run by a process (each worker in multiprocessing mode)
+            or made fresh for each test, and removed afterwards. Tests that
+            write files can then run in parallel. The files and directories in
+            shared_files are copied once for the run, made read-only and
+            symlinked into every scratch directory, so tests can't change the
+            originals. Those in writable_files are copied into every scratch
+            directory instead.
+
+        Compact responses:
+            If compact is True (or a ResponseStore), the responses of each
+            test are replaced by compact ones once it has run: passing
+            responses only keep digests, identical responses are shared and
+            large failing outputs are spilled to compressed files that are
+            loaded when they're read.
+
+        Metrics:
+            If metrics is a MetricsRegistry (or a path to write one to, or
+            True), the outcomes and durations of the tests, the time spent
+            calling and diffing the student and solution code and, in
+            multiprocessing mode, the worker utilization and queue depth are
+            recorded in it (see autograder.metrics). Without it, the metrics
+            are recorded in the registry of the enclosing
+            metrics.recording() context, if any.
+
+        Multiprocessing:
+            Tests are sent to the workers in chunks which are sized so that
+            each chunk takes about chunk_time seconds to run, based on how long
+            the tests that have already run took.
+
+            Tests are sent as TestDescriptors (references to the functions
+            they test rather than the functions themselves) so that they can
+            be rebuilt under any start_method ('fork', 'spawn' or
+            'forkserver'; None uses the platform default). Tests that can't be
+            described (like tests of lambdas) are only supported with 'fork',
+            where the workers inherit them from the parent process.
+
+            Suite-scoped fixtures are built once per worker, except for shared
+            fixtures, which are built once here and memory-mapped by the
+            workers.
         """
         # Initialize the tests
         self.tests = []
@@ -62,6 +291,54 @@ class TestSuite:
 
         self.multiprocess = multiprocess
         self.ml = ml
+        self.chunk_time = chunk_time
+        self.start_method = start_method
+
+        # The cache of the suite-scoped fixtures while the suite runs
+        self._fixtures = None
+
+        self.scratch = None
+        if scratch:
+            self.scratch = ScratchDirectory(scratch, shared_files,
+                                            writable_files)
+
+        if compact is True:
+            from .compact import ResponseStore
+            compact = ResponseStore()
+
+        self.response_store = compact or None
+
+        if metrics is True or isinstance(metrics, str):
+            metrics = MetricsRegistry(None if metrics is True else metrics)
+
+        self.metrics = metrics or None
+
+        # The registry recorded into while running
+        self._metrics = None
+
+        # Set while running under journal_tests
+        self._journal = None
+        self._suite_number = None
+
+        if profile is None and '--profile' in sys.argv:
+            profile = True
+
+        if profile is True or isinstance(profile, str):
+            from .profiling import Profiler
+            profile = Profiler() if profile is True else Profiler(profile)
+
+        self.profiler = profile or None
+        self.profile_output = profile_output
+
+        if coverage is None and '--coverage' in sys.argv:
+            coverage = True
+
+        if coverage is True:
+            from .line_coverage import CoverageCollector
+            coverage = CoverageCollector()
+
+        self.coverage = coverage or None
+        self.test_coverage = []
 
 
     def add_test(self, test):
@@ -91,70 +368,377 @@ class TestSuite:
             print()
             self.ml(self.pass_list)
 
+        if self.profiler:
+            print()
+            print(HeaderMessage("Hot spots in the student code"))
+            print(self.profiler.report())
+
+            if self.profile_output:
+                self.profiler.dump(self.profile_output)
+
+        if self.coverage:
+            print()
+            print(HeaderMessage("Coverage of the student code"))
+            print(self.coverage.report())
+
+        if self._metrics:
+            self._metrics.flush()
+
+
+    @staticmethod
+    def _describe_test(test, can_inherit):
+        """
+        Returns what to send the workers for test: None if they inherit the
+        tests from this process (with the 'fork' start method), a
+        TestDescriptor if test can be rebuilt from one, or else test itself to
+        be pickled. Raises a DescriptorError if it can't be sent at all.
+        """
+        if can_inherit:
+            return None
+
+        try:
+            descriptor = test.describe()
+
+            # Make sure the test really rebuilds from its descriptor (a
+            # subclass may take arguments that _describe doesn't know about)
+            if type(descriptor.resolve()) is type(test):
+                return descriptor
+        except Exception:
+            pass
+
+        import pickle
+        try:
+            pickle.dumps(test)
+        except Exception as e:
+            raise DescriptorError(
+                f"'{test.start_msg.strip()}' can't be sent to a "
+                f"multiprocessing worker ({e}). Use the 'fork' start method "
+                f"to run it."
+            ) from e
+
+        return test
+
 
     def _run_mp(self):
         """
         Runs the tests in a multiprocessing pool.
         """
+        import multiprocessing as mp
+
         # Twice as many workers because why not?
         num_workers = mp.cpu_count() * 2
-        manager = mp.Manager()
-        passed_q = manager.Queue()
-
-        # Two resources for printing: the process that can print and the condn
-        print_val = manager.Value(int, 0)
-        print_condn = manager.Condition()
-
-        # Put the tests into a pool.
-        with mp.Pool(num_workers) as p:
-            p.starmap(
-                TestRunner(passed_q, print_val, print_condn), 
-                enumerate(self.tests)
-            )
 
-        # Calculate the number that passed and build a list for ML
-        num_passed = 0
+        profiler = self.profiler.empty_copy() if self.profiler else None
+        coverage = self.coverage.empty_copy() if self.coverage else None
+        context = mp.get_context(self.start_method)
+        can_inherit = context.get_start_method() == 'fork'
+        payloads = [self._describe_test(test, can_inherit)
+                    for test in self.tests]
+
+        # Only the tests that the journal has no results for are sent out
+        finished = {}
+        for index, test in enumerate(self.tests):
+            replayed = self._replay(index, test)
+            if replayed:
+                passed, out = replayed
+                finished[index] = (passed, out, None, True)
+        pending = [index for index in range(len(self.tests))
+                   if index not in finished]
+        sizer = ChunkSizer(len(pending), num_workers, self.chunk_time)
+
+        shared_fixtures = self._share_fixtures(pending)
+        runner = TestRunner(profiler, coverage, shared_fixtures, self.scratch,
+                            self._metrics is not None)
+
+        global _forked_tests
+        _forked_tests = self.tests
+
+        # Build a list for ML
         self.pass_list = [0] * len(self.tests)
-        while not passed_q.empty():
-            index, passed = passed_q.get()
-            if passed:
-                num_passed += 1
-                self.pass_list[index] = 1
+        self.test_coverage = [{} for _ in self.tests]
+
+        try:
+            num_passed = self._run_pool(context, num_workers, runner, pending,
+                                        payloads, sizer, finished)
+        finally:
+            for path in shared_fixtures.values():
+                os.remove(path)
 
         self._close_suite(len(self.tests), num_passed)
 
 
+    def _share_fixtures(self, indices):
+        """
+        Builds the shared fixtures needed by the tests at indices and writes
+        them to files for the workers. Returns a dict of fixture key -> path.
+        """
+        shared = {}
+        for index in indices:
+            for used in self.tests[index].fixtures_used():
+                for fixture in used.closure():
+                    if fixture.shared and fixture.key not in shared:
+                        shared[fixture.key] = dump_shared(
+                            self._fixtures.get(fixture)
+                        )
+
+        return shared
+
+
+    def _run_pool(self, context, num_workers, runner, pending, payloads,
+                  sizer, finished):
+        """
+        Runs the pending tests in a pool of workers and prints the results of
+        all of the tests in order. Returns the number of tests that passed.
+        """
+        import queue
+
+        results_q = queue.Queue()
+        num_passed = 0
+        with context.Pool(num_workers) as p:
+            next_pending = 0
+
+            # The number of tests sent out that haven't returned and the time
+            # the workers have spent running tests
+            queued = 0
+            busy = 0.0
+            start = time.perf_counter()
+
+            def submit():
+                nonlocal next_pending, queued
+                size = sizer.next_size()
+                chunk = [(index, payloads[index]) for index
+                         in pending[next_pending:next_pending + size]]
+                next_pending += size
+                queued += size
+                self._observe_queue(queued)
+
+                p.apply_async(runner, (chunk,), callback=results_q.put,
+                              error_callback=results_q.put)
+
+            # Keep two chunks in flight per worker
+            in_flight = 0
+            while next_pending < len(pending) and in_flight < 2 * num_workers:
+                submit()
+                in_flight += 1
+
+            # Print the results in test order as they come in
+            next_to_print = 0
+            while True:
+                while next_to_print in finished:
+                    passed, out, progressive, replayed = finished.pop(
+                        next_to_print
+                    )
+                    if progressive:
+                        # Ask about the progressive diff now that it's this
+                        # test's turn to print
+                        print(out, end='')
+                        choice = ask_progressive_choice()
+                        rendered = progressive.render(choice) + '\n'
+                        print(rendered, end='')
+                        out += rendered
+                    else:
+                        print(out, end='')
+
+                    if not replayed:
+                        self._record(next_to_print, passed, out)
+                    if passed:
+                        num_passed += 1
+                        self.pass_list[next_to_print] = 1
+                    next_to_print += 1
+
+                if next_to_print >= len(self.tests):
+                    break
+
+                result = results_q.get()
+                if isinstance(result, BaseException):
+                    raise result
+
+                results, elapsed, metrics = result
+                sizer.record(len(results), elapsed)
+                queued -= len(results)
+                busy += elapsed
+                self._observe_queue(queued)
+                if self._metrics:
+                    self._metrics.merge(metrics)
+                    self._metrics.worker_busy_seconds.inc(elapsed)
+                    self._metrics.worker_utilization.set(
+                        busy / (num_workers * (time.perf_counter() - start))
+                    )
+                if next_pending < len(pending):
+                    submit()
+
+                for index, passed, out, progressive, profile, coverage \
+                        in results:
+                    finished[index] = (passed, out, progressive, False)
+                    if profile:
+                        self.profiler.merge(*profile)
+                    if coverage:
+                        self.coverage.merge(*coverage)
+                        self.test_coverage[index] = coverage[0]
+
+            # Let the workers exit on their own so they tear down their
+            # fixtures
+            p.close()
+            p.join()
+
+        return num_passed
+
+
+    def _observe_queue(self, depth):
+        """
+        Records the number of tests waiting in the multiprocessing queue.
+        """
+        if self._metrics:
+            self._metrics.queue_depth.set(depth)
+            self._metrics.queue_depth_samples.observe(depth)
+
+
+    def _replay(self, index, test):
+        """
+        Returns the (passed, output) of test from the journal, or None if it
+        has to be run.
+        """
+        if self._journal is None:
+            return None
+        return self._journal.lookup(self._suite_number, index, test.start_msg)
+
+
+    def _record(self, index, passed, out):
+        """
+        Records the result of the test at index in the journal, if there is
+        one.
+        """
+        if self._journal is not None:
+            self._journal.record(self._suite_number, index,
+                                 self.tests[index].start_msg, bool(passed),
+                                 out)
+
+
+    def _run_journaled(self, index, test):
+        """
+        Runs test, or prints its output from the journal if it was already
+        run, and returns whether it passed.
+        """
+        if self._journal is None:
+            passed = self._run_test(test)
+            self._compact(test, passed)
+            return passed
+
+        replayed = self._replay(index, test)
+        if replayed:
+            passed, out = replayed
+        else:
+            f = io.StringIO()
+            with contextlib.redirect_stdout(f):
+                passed = self._run_test(test)
+            out = f.getvalue()
+            self._record(index, passed, out)
+            self._compact(test, passed)
+
+        print(out, end='')
+        return passed
+
+
+    def _run_test(self, test):
+        """
+        Runs test (in the scratch directory, if any), records its metrics and
+        returns whether it passed. A progressive diff is asked about after
+        the test is timed, so its time doesn't include the grader's answer.
+        """
+        deferred = test.defer_progressive
+        test.defer_progressive = True
+        test.progressive = None
+
+        start = time.perf_counter()
+        try:
+            with _entered(self.scratch):
+                passed = test.run()
+        finally:
+            test.defer_progressive = deferred
+        if self._metrics:
+            self._metrics.observe_test(test, passed,
+                                       time.perf_counter() - start)
+
+        if test.progressive is not None and not deferred:
+            print(test.progressive.render(ask_progressive_choice()))
+        return passed
+
+
+    def _compact(self, test, passed):
+        """
+        Replaces the responses of test with compact ones, if enabled. The
+        responses are kept as they are if they can't be compacted, since the
+        test has already been graded.
+        """
+        store = self.response_store or _response_store
+        if store is not None:
+            try:
+                store.compact_test(test, passed)
+            except Exception:
+                pass
+
+
     def _run_normal(self):
         """
         Runs all of the tests in order.
         """
         num_passed, num_tests = 0, len(self.tests)
         self.pass_list = []
+        self.test_coverage = []
 
-        for test in self.tests:
-            if test.run():
+        for index, test in enumerate(self.tests):
+            if self._run_journaled(index, test):
                 # Test passed
                 num_passed += 1
                 self.pass_list.append(1)
             else:
                 self.pass_list.append(0)
 
+            if self.coverage:
+                coverage = self.coverage.collect()
+                self.coverage.merge(*coverage)
+                self.test_coverage.append(coverage[0])
+
         self._close_suite(num_tests, num_passed)
 
 
     def run(self):
-        # Progressive mode cannot run with multiprocessing.
-        is_progressive = '-p' in sys.argv or '--progressive' in sys.argv
+        self._journal = _test_journal
+        if self._journal is not None:
+            self._suite_number = self._journal.next_suite()
 
-        if self.multiprocess and (not is_progressive):
-            self._run_mp()
+        all_tests = self.tests
+        if _test_filter is not None:
+            selected = [test for test in all_tests if _test_filter(test)]
+            if not selected:
+                return
+            self.tests = selected
 
-        else:
+        self._metrics = self.metrics or active()
+        try:
+            with recording(self._metrics):
+                self._run_selected()
+        finally:
+            self.tests = all_tests
+            self._metrics = None
+
+
+    def _run_selected(self):
+        self._fixtures = FixtureCache('suite')
+        for test in self.tests:
+            test.profiler = self.profiler
+            test.coverage = self.coverage
+            test.fixture_cache = self._fixtures
+
+        try:
+            if self.scratch:
+                self.scratch.stage()
             if self.multiprocess:
-                no_progressive = StatusMessage(
-                    ("Progressive mode is incompatible with multiprocessing. "
-                     "The autograder will run \nin a single process."),
-                    'warning'
-                )
-                print(no_progressive)
-            self._run_normal()
\ No newline at end of file
+                self._run_mp()
+            else:
+                self._run_normal()
+        finally:
+            self._fixtures.close()
+            self._fixtures = None
+            if self.scratch:
+                self.scratch.close()
\ No newline at end of file
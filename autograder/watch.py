@@ -0,0 +1,224 @@
+"""
+File: autograder/watch.py
+-------------------------
+
+Keeps the autograder running and reruns the tests affected by each change to
+the student module as soon as it is saved.
+"""
+
+import ast
+import hashlib
+import importlib
+import importlib.util
+import os
+import time
+
+from .loading import IMPORT_OK, guarded_import
+from .printing import StatusMessage, HeaderMessage
+from .testsuite import select_tests
+
+# The key for the top-level statements that aren't functions or classes
+MODULE_LEVEL = '<module>'
+
+
+def analyze(source):
+    """
+    Hashes the source of each top-level function and class in source and
+    finds the other top-level names each one refers to.
+
+    Returns
+    -------
+    tuple -- A dict mapping each name (and MODULE_LEVEL) to a hash of its
+        syntax tree and a dict mapping each name to the set of top-level
+        names it refers to.
+    """
+    tree = ast.parse(source)
+    hashes = {}
+    references = {}
+    module_level = []
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                             ast.ClassDef)):
+            hashes[node.name] = hashlib.sha256(
+                ast.dump(node).encode()
+            ).hexdigest()
+            references[node.name] = {
+                child.id for child in ast.walk(node)
+                if isinstance(child, ast.Name)
+            }
+        else:
+            module_level.append(ast.dump(node))
+
+    hashes[MODULE_LEVEL] = hashlib.sha256(
+        '\n'.join(module_level).encode()
+    ).hexdigest()
+
+    for name in references:
+        references[name] &= hashes.keys()
+
+    return hashes, references
+
+
+def affected_names(old_hashes, new_hashes, references):
+    """
+    Returns the names whose code changed along with every name that depends
+    on them (directly or indirectly), or None if the module-level code
+    changed, in which case everything is affected.
+    """
+    changed = {name for name in old_hashes.keys() | new_hashes.keys()
+               if old_hashes.get(name) != new_hashes.get(name)}
+
+    if MODULE_LEVEL in changed:
+        return None
+
+    affected = set(changed)
+    grew = True
+    while grew:
+        grew = False
+        for name, refs in references.items():
+            if name not in affected and refs & affected:
+                affected.add(name)
+                grew = True
+
+    return affected
+
+
+class Watcher:
+    """
+    Watches the student module of an autograder and reruns the tests that
+    touch the functions that changed.
+    """
+
+    def __init__(self, autograder, interval=0.1):
+        """
+        Arguments
+        ---------
+        autograder (Autograder) -- An autograder which has already run (so
+            its module is loaded).
+        interval (float) -- The number of seconds between checks for changes.
+        """
+        self.autograder = autograder
+        self.interval = interval
+        self.path = autograder.module.__file__
+
+        with open(self.path) as f:
+            self.hashes, _ = analyze(f.read())
+        self.mtime = os.stat(self.path).st_mtime_ns
+
+
+    def _is_affected(self, test, affected):
+        """
+        Returns whether test touches one of the affected names.
+        """
+        student_obj = test.student_obj
+        module_name = self.autograder.module.__name__
+        if getattr(student_obj, '__module__', None) != module_name:
+            # Not a function from the student module: always rerun
+            return True
+
+        name = getattr(student_obj, '__qualname__', '').split('.')[0]
+        return name in affected
+
+
+    def _reload(self):
+        """
+        Reloads the student module in place under the import budgets of the
+        autograder and reapplies the overrides. Returns the ImportResult.
+        """
+        # The cached bytecode is keyed on the mtime in seconds, so it can be
+        # stale after quick successive saves.
+        try:
+            os.remove(importlib.util.cache_from_source(self.path))
+        except (OSError, NotImplementedError):
+            pass
+
+        autograder = self.autograder
+        result = guarded_import(
+            autograder.module.__name__, autograder.import_timeout,
+            autograder.import_memory_limit, autograder.probe_import,
+            reload=True
+        )
+        if result.status == IMPORT_OK:
+            result.module.__dict__.update(autograder.module_overrides)
+            autograder.module = result.module
+        return result
+
+
+    def check(self):
+        """
+        Checks the module for changes once and reruns the affected tests.
+        Returns whether anything was rerun.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            # Some editors briefly remove the file while saving it
+            return False
+
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+
+        with open(self.path) as f:
+            source = f.read()
+
+        try:
+            hashes, references = analyze(source)
+        except SyntaxError as e:
+            print(StatusMessage(f"Syntax error: {e}", 'fail'))
+            return False
+
+        affected = affected_names(self.hashes, hashes, references)
+        self.hashes = hashes
+        if affected is not None and not affected:
+            return False
+
+        start = time.perf_counter()
+        print(HeaderMessage(
+            f"{os.path.basename(self.path)} changed, rerunning "
+            + ("all tests" if affected is None
+               else f"tests of {', '.join(sorted(affected))}")
+            + "..."
+        ))
+
+        result = self._reload()
+        if result.stdout:
+            print(result.stdout, end='' if result.stdout.endswith('\n')
+                  else '\n')
+        if result.status != IMPORT_OK:
+            print(StatusMessage(
+                f"Couldn't reload the module ({result.status}).", 'fail'
+            ))
+            print(result.error)
+            return False
+
+        if affected is None:
+            self.autograder.run_custom_tests()
+        else:
+            with select_tests(lambda test: self._is_affected(test, affected)):
+                self.autograder.run_custom_tests()
+
+        elapsed = (time.perf_counter() - start) * 1000
+        print(StatusMessage(f"Finished in {elapsed:.0f}ms.", 'info'))
+        return True
+
+
+    def run(self):
+        """
+        Watches the module until interrupted.
+        """
+        print()
+        print(StatusMessage(
+            f"Watching {self.path} for changes (press Ctrl-C to stop)...",
+            'info'
+        ))
+
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.check()
+
+        except KeyboardInterrupt:
+            print()
+            print(StatusMessage('Stopped watching.', 'info'))